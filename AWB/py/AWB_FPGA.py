@@ -6,25 +6,115 @@
 # -----------------------------------------README-----------------------------------------
 # 以G通道为基准，把三个通道的均值调整到同一水平。
 #
+# 也可以输入N×H×W×3的多帧数据，每帧单独统计通道均值。
+# 前级已经统计了通道和时（`raw2rgb_stats`）用`AWB(img, stats)`。
+# 通道和可以隔行隔列取样（`stride`），误差见`scripts/substats.py`。
+#
+# 视频序列用`AWBVideo`：与awb.v相同，用上一帧的通道均值处理本帧，同时累加本帧各通道的和，
+# 按行块进行，每个像素只读一遍。第一帧原样输出（RTL中均值的复位值为128，增益为1），
+# smooth=k时通道和在帧间平滑（见`scripts/temporal.py`），k=0时与RTL一致。
+#
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
 from time import time
+import sys
+sys.path.append("./scripts/")
+from temporal import smooth
+
+
+def channel_sum(img: np.ndarray, stride: int = 1) -> np.ndarray:
+    """统计各通道的和，按[b, g, r]排列，多帧时每帧一组。
+    先逐行累加成一行（uint32，整行连续相加），再对这一行求和，比直接按通道归约快很多。
+    stride>1时每stride行、stride列取一个像素，结果按整帧与取样的像素数之比放大，sum2mean的右移21位不变"""
+    if stride > 1:
+        sub = img[..., ::stride, ::stride, :]
+        return channel_sum(sub) * (img.shape[-3] * img.shape[-2]) // (sub.shape[-3] * sub.shape[-2])
+    return img.sum(axis=-3, dtype=np.uint32).sum(axis=-2, dtype=np.int64)
+
+
+def sum2mean(ch_sum: np.ndarray) -> np.ndarray:
+    """通道和右移21位作为均值"""
+    return ch_sum // (2**21)
+
+
+def channel_mean(img: np.ndarray) -> np.ndarray:
+    return sum2mean(channel_sum(img))
+
+
+def gain_table(mean: np.ndarray) -> np.ndarray:
+    """以G通道为基准的增益映射表，按[b, g, r]排列，形状为(..., 3, 256)"""
+    mean = np.asarray(mean)[..., None]
+    dst = np.arange(256, dtype=np.int32) * mean[..., 1:2, :] // mean
+    return dst.clip(0, 255).astype(np.uint8)
 
 
-def AWB(img: np.ndarray) -> np.ndarray:
-    r = img[:, :, 2].sum() // (2**21)
-    g = img[:, :, 1].sum() // (2**21)
-    b = img[:, :, 0].sum() // (2**21)
-    dst = img.astype(np.int32) * g // np.array([b, g, r])
-    dst = dst.clip(0, 255).astype(np.uint8)
+def apply_gain(img: np.ndarray, mean: np.ndarray) -> np.ndarray:
+    """以G通道为基准调整各通道增益"""
+    return apply_table(img, gain_table(mean))
+
+
+def apply_table(img: np.ndarray, table: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """每个通道查一次增益映射表，结果写入out"""
+    dst = np.empty_like(img) if out is None else out
+    for ch in range(3):
+        if table.ndim == 2:
+            dst[..., ch] = table[ch][img[..., ch]]
+        else:  # 多帧时每帧一张表
+            frames = img.shape[:-3]
+            index = img[..., ch].reshape(np.prod(frames), -1)
+            lut = table[..., ch, :].reshape(-1, 256)
+            dst[..., ch] = np.take_along_axis(lut, index, axis=-1).reshape(img.shape[:-1])
     return dst
 
 
+def AWB(img: np.ndarray, stats: dict = None, stride: int = 1) -> np.ndarray:
+    """stats为raw2rgb_stats等前级已经统计好的量，有"sum"时不再统计通道和；stride为通道和的取样间隔"""
+    mean = sum2mean(channel_sum(img, stride)) if stats is None else sum2mean(stats["sum"])
+    return apply_gain(img, mean)
+
+
+class AWBVideo:
+    """视频模式的AWB，push(band, last)与scripts/stream.py的各级接口相同"""
+
+    def __init__(self, smooth: int = 0, band: int = 64):
+        self.smooth = smooth
+        self.band = band
+        self.table = None  # 上一帧的增益映射表
+        self.state = None  # 平滑后的通道和
+        self.sum = np.zeros(3, dtype=np.int64)
+
+    def push(self, band: np.ndarray, last: bool, out: np.ndarray = None) -> np.ndarray:
+        """调整一个行块的增益并累加它的通道和，last表示一帧的最后一块"""
+        self.sum += channel_sum(band)
+        if out is None:
+            out = np.empty_like(band)
+        if self.table is None:
+            np.copyto(out, band)
+        else:
+            apply_table(band, self.table, out)
+        if last:
+            self.state, ch_sum = smooth(self.state, self.sum, self.smooth)
+            self.table = gain_table(sum2mean(ch_sum))
+            self.sum[:] = 0
+        return out
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """处理一帧，N×H×W×3时按顺序处理各帧"""
+        out = np.empty_like(img)
+        for frame, dst in zip(img, out) if img.ndim == 4 else [(img, out)]:
+            height = frame.shape[0]
+            for r0 in range(0, height, self.band):
+                r1 = min(r0 + self.band, height)
+                self.push(frame[r0:r1], r1 == height, dst[r0:r1])
+        return out
+
+
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+
     path = "./img/day-0.png"
     src = cv2.imread(path)[4:1084, 8:1928]
 
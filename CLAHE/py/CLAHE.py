@@ -16,6 +16,8 @@ from time import time
 
 
 def CLAHE(img: np.ndarray, block: int = 8):
+    if img.ndim == 3:  # 多帧数据逐帧处理
+        return np.stack([CLAHE(frame, block) for frame in img])
     height, width = img.shape
     block_w = width // block
     block_h = height // block
@@ -4,19 +4,35 @@
 # File Name:        CLAHE_FPGA.py
 # Descriptions:     限制对比度的自适应直方图均衡化（硬件思路验证）
 # -----------------------------------------README-----------------------------------------
-# 对硬件设计思路的验证，执行效率很低。
+# 对硬件设计思路的验证。`CLAHE_loop`逐像素调用`pre_calculate`和`ave`，与RTL一一对应，执行效率很低；
+# `CLAHE`用整帧数组运算实现同样的整数运算，结果逐位一致，
+# 分为`tile_histogram`、`tile_cdf`、`tile_apply`三步，统计和映射都可以按行分块进行。
+# `pre_calculate`、`ave`和`CLAHE_loop`的各个循环用`@jit`标记，ISP_JIT=1时由numba编译（scripts/jit.py），写法不变。
 #
-# 可以对RGB彩图做处理：先转换到HSV空间，对V通道做处理，然后再还原回RGB。
+# 前级已经统计了块直方图时（`raw2rgb_stats`）用`CLAHE(img, block, stats)`。
+# 块直方图可以隔行隔列取样（`stride`），误差见`scripts/substats.py`。
+#
+# 图像的h和w必须是`block`的整数倍。也可以输入N×H×W×3的多帧数据，各帧的块直方图在一次bincount中完成。
+#
+# 可以对RGB彩图做处理：先转换到HSV空间，对V通道做处理，然后再用`scripts/hsv.py`的`rescale_v`还原回RGB。
+#
+# 视频序列用`CLAHEVideo`：与clahe_core.v相同，用上一帧各块的累积分布处理本帧，同时统计本帧的块直方图，
+# 按行块进行，每个像素只读一遍。第一帧原样输出，smooth=k时块直方图在帧间平滑（见`scripts/temporal.py`）。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
 from time import time
+import sys
+sys.path.append("./scripts/")
+from hsv import rescale_v
+from temporal import smooth
+from jit import jit
 
 
+@jit
 def pre_calculate(loc, factor, src_shape):
     num = [0, 0, 0, 0]
     i, j = loc
@@ -41,6 +57,7 @@ def pre_calculate(loc, factor, src_shape):
     return num, u, v
 
 
+@jit
 def ave(weight, factor, src_value):
     u, v = weight
     factor_h, factor_w = factor
@@ -51,16 +68,148 @@ def ave(weight, factor, src_value):
     return dst
 
 
-def hsv2bgr(bgr: np.ndarray, new_V: np.ndarray):
-    tmp = bgr.astype(np.uint32) * new_V.astype(np.uint32)[:, :, None]
-    m = bgr.astype(np.uint32).max(axis=-1)[:, :, None]
-    m[m == 0] = 1  # 避免除零
-    dst = tmp / m
-    dst = dst.clip(0, 255).astype(np.uint8)
-    return dst
+def tile_table(length: int, factor: int, block: int):
+    """沿一个方向预计算每个坐标的相邻两块编号及权重，与`pre_calculate`一致"""
+    idx = np.arange(length, dtype=np.int32)
+    block_idx = idx // factor
+    flag = idx % factor < factor // 2
+    num = np.where(block_idx == 0, 0, block_idx - flag)
+    edge = ((block_idx == 0) & flag) | ((block_idx == block - 1) & ~flag)
+    num_next = np.where(edge, num, num + 1)
+    weight = idx - (num * factor + factor // 2)
+    return num, num_next, weight
+
+
+def index_dtype(limit: int):
+    """下标不超过limit时用int32，多帧堆叠较多时改用int64，避免溢出"""
+    return np.int32 if limit < 2**31 else np.int64
+
+
+def tile_histogram(gray: np.ndarray, block: int, height: int, row0: int = 0, stride: int = 1) -> np.ndarray:
+    """统计各块直方图。gray可以是整帧中从row0开始的若干行，height为整帧高度，各部分的结果可以直接相加。
+    stride>1时取整帧坐标为stride倍数的行列，每块的计数按块内与取样的像素数之比放大（向下取整），
+    每块总数不超过块内像素数，tile_cdf中的LIMIT和SCALE不变"""
+    rows, width = gray.shape[-2:]
+    frames = gray.shape[:-2]
+    num = int(np.prod(frames))  # 帧数，单帧时为1
+    block_h = height // block
+    block_w = width // block
+    frame = (np.arange(num, dtype=index_dtype(num * block * block * 256)) * (block * block))[:, None, None]
+    row_idx = np.arange(row0, row0 + rows, dtype=np.int32)
+    col_idx = np.arange(width, dtype=np.int32)
+    if stride > 1:  # 按整帧坐标取样，各行块的取样位置互相衔接
+        first = -row0 % stride
+        full = np.outer(np.bincount(row_idx // block_h, minlength=block), np.bincount(col_idx // block_w, minlength=block))
+        gray = gray[..., first::stride, ::stride]
+        row_idx = row_idx[first::stride]
+        col_idx = col_idx[::stride]
+        sampled = np.outer(np.bincount(row_idx // block_h, minlength=block), np.bincount(col_idx // block_w, minlength=block))
+    row_num = (row_idx // block_h) * block
+    col_num = col_idx // block_w
+    index = ((frame + row_num[:, None] + col_num) << 8) | gray.reshape(num, row_idx.size, col_idx.size)
+    pdf = np.bincount(index.ravel(), minlength=num * block * block * 256).reshape(frames + (block, block, 256))
+    if stride > 1:
+        pdf = pdf * full[..., None] // np.maximum(sampled, 1)[..., None]
+    return pdf
+
+
+def tile_cdf(pdf: np.ndarray, total: int) -> np.ndarray:
+    """限制对比度，计算各块累积分布直方图，total为每块的像素数"""
+    LIMIT = 4 * total // 256
+    steal = np.maximum(pdf - LIMIT, 0).sum(axis=-1, keepdims=True)
+    pdf = np.minimum(pdf, LIMIT) + steal // 256
+    return (pdf.cumsum(axis=-1) // 128).astype(np.int32)
+
+
+def tile_apply(img: np.ndarray, cdf: np.ndarray, height: int, row0: int = 0, gray: np.ndarray = None, out: np.ndarray = None):
+    """用各块累积分布做插值映射，结果写入out。img可以是整帧中从row0开始的若干行，height为整帧高度"""
+    if gray is None:
+        gray = np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2])
+    rows, width = gray.shape[-2:]
+    num = int(np.prod(gray.shape[:-2]))
+    block = cdf.shape[-2]
+    block_h = height // block
+    block_w = width // block
+    TOTAL = block_h * block_w
+    SCALE = TOTAL * TOTAL // 255 // 128 // 256
+
+    # 先逐行完成上下两块的插值，得到每行的(块列, 灰度)查找表，再逐像素做左右插值
+    num_i, next_i, v = (x[row0 : row0 + rows] for x in tile_table(height, block_h, block))
+    num_j, next_j, u = tile_table(width, block_w, block)
+    v = v[:, None, None]
+    cdf = cdf.reshape(num, block, block, 256)
+    gray = gray.reshape(num, rows, width)
+    new_V = np.empty((num, rows, width), dtype=np.uint8)
+    step = max(1, 4096 // max(rows, 1))  # 每次处理的帧数，限制中间表的大小，多帧堆叠时下标也不会超过int32
+    for f in range(0, num, step):
+        tmp_mul = ((block_h - v) * cdf[f : f + step, num_i] + v * cdf[f : f + step, next_i]) >> 8
+        n = tmp_mul.shape[0]
+        tmp_mul = tmp_mul.ravel()
+        row = (np.arange(n * rows, dtype=np.int32) * (block * 256)).reshape(n, rows, 1)
+        tmp_mul_0 = tmp_mul[(row + (num_j << 8)) | gray[f : f + step]]
+        tmp_mul_1 = tmp_mul[(row + (next_j << 8)) | gray[f : f + step]]
+        new_V[f : f + step] = ((block_w - u) * tmp_mul_0 + u * tmp_mul_1) // SCALE
+    return rescale_v(img, new_V.reshape(img.shape[:-1]), gray.reshape(img.shape[:-1]), out)
+
+
+def CLAHE(img: np.ndarray, block: int = 8, stats: dict = None, stride: int = 1):
+    """stats为raw2rgb_stats等前级已经统计好的量，有"tiles"时不再统计块直方图；stride为块直方图的取样间隔"""
+    gray = np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2])
+    height, width = gray.shape[-2:]
+    if stats is None:
+        pdf = tile_histogram(gray, block, height, stride=stride)
+    elif stats["tiles"].shape[-3:-1] != (block, block):
+        raise ValueError(f"tile histograms are {stats['tiles'].shape[-3]}x{stats['tiles'].shape[-2]}, expected {block}x{block}")
+    else:
+        pdf = stats["tiles"]
+    cdf = tile_cdf(pdf, (height // block) * (width // block))
+    return tile_apply(img, cdf, height, gray=gray)
+
+
+class CLAHEVideo:
+    """视频模式的CLAHE，push(band, last)与scripts/stream.py的各级接口相同，height为整帧高度"""
+
+    def __init__(self, height: int = None, block: int = 8, smooth: int = 0, band: int = 64):
+        self.height = height
+        self.block = block
+        self.smooth = smooth
+        self.band = band
+        self.row = 0  # 下一个行块在帧内的起始行
+        self.cdf = None  # 上一帧各块的累积分布
+        self.state = None  # 平滑后的块直方图
+        self.pdf = 0
+
+    def push(self, band: np.ndarray, last: bool, out: np.ndarray = None) -> np.ndarray:
+        """映射一个行块并统计它的块直方图，last表示一帧的最后一块"""
+        gray = np.maximum(np.maximum(band[..., 0], band[..., 1]), band[..., 2])
+        self.pdf = self.pdf + tile_histogram(gray, self.block, self.height, self.row)
+        if out is None:
+            out = np.empty_like(band)
+        if self.cdf is None:
+            np.copyto(out, band)
+        else:
+            tile_apply(band, self.cdf, self.height, self.row, gray, out)
+        self.row += band.shape[0]
+        if last:
+            width = band.shape[1]
+            self.state, pdf = smooth(self.state, self.pdf, self.smooth)
+            self.cdf = tile_cdf(pdf, (self.height // self.block) * (width // self.block))
+            self.pdf = 0
+            self.row = 0
+        return out
 
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """处理一帧，N×H×W×3时按顺序处理各帧"""
+        out = np.empty_like(img)
+        self.height = img.shape[-3]
+        for frame, dst in zip(img, out) if img.ndim == 4 else [(img, out)]:
+            for r0 in range(0, self.height, self.band):
+                r1 = min(r0 + self.band, self.height)
+                self.push(frame[r0:r1], r1 == self.height, dst[r0:r1])
+        return out
 
-def CLAHE(img: np.ndarray, block: int = 8):
+
+def CLAHE_loop(img: np.ndarray, block: int = 8):
     gray = img.max(axis=-1)
     height, width = gray.shape
     block_h = height // block
@@ -69,10 +218,30 @@ def CLAHE(img: np.ndarray, block: int = 8):
     LIMIT = 4 * TOTAL // 256
     SCALE = TOTAL * TOTAL // 255 // 128 // 256
 
-    pdf = np.zeros((block * block, 256), dtype=int)
-    cdf = np.zeros((block * block, 256))
+    pdf = np.zeros((block * block, 256), dtype=np.int64)
+    cdf = np.zeros((block * block, 256), dtype=np.int64)
 
     # 统计各块直方图分布
+    tile_pixels(gray, block, pdf)
+    # 限制对比度，计算各块累积分布直方图
+    clip_tiles(pdf, block, LIMIT, cdf)
+    cdf = cdf // 128
+
+    print("cdf done!")
+
+    new_V = np.empty(gray.shape, dtype=np.int64)
+    # 均衡化
+    equalize_pixels(gray, cdf, new_V)
+    new_V = (new_V // SCALE).astype(np.uint8)
+    dst = rescale_v(img, new_V, gray)
+    return dst
+
+
+@jit
+def tile_pixels(gray, block, pdf):
+    height, width = gray.shape
+    block_h = height // block
+    block_w = width // block
     for i in range(height):
         for j in range(width):
             block_i = i // block_h
@@ -81,7 +250,9 @@ def CLAHE(img: np.ndarray, block: int = 8):
             index = gray[i][j]
             pdf[num][index] += 1
 
-    # 限制对比度，计算各块累积分布直方图
+
+@jit
+def clip_tiles(pdf, block, LIMIT, cdf):
     for i in range(block):
         for j in range(block):
             num = i * block + j
@@ -91,7 +262,6 @@ def CLAHE(img: np.ndarray, block: int = 8):
                 if pdf[num][k] > LIMIT:
                     steal += pdf[num][k] - LIMIT
                     pdf[num][k] = LIMIT
-            # print(steal)
             bonus = steal // 256
             # 计算累积分布直方图
             for k in range(256):
@@ -101,14 +271,12 @@ def CLAHE(img: np.ndarray, block: int = 8):
                     cdf[num][k] = pdf[num][k]
                 else:
                     cdf[num][k] = cdf[num][k - 1] + pdf[num][k]
-    cdf = cdf // 128
 
-    print("cdf done!")
 
-    new_V = np.ndarray(gray.shape)
+@jit
+def equalize_pixels(gray, cdf, new_V):
+    height, width = gray.shape
     tmp_cdf = [0, 0, 0, 0]
-    num = [0, 0, 0, 0]
-    # 均衡化
     for i in range(height):
         for j in range(width):
             num, u, v = pre_calculate((i, j), (height // 8, width // 8), (8, 8))
@@ -117,12 +285,11 @@ def CLAHE(img: np.ndarray, block: int = 8):
             tmp_cdf[2] = cdf[num[2]][gray[i][j]]
             tmp_cdf[3] = cdf[num[3]][gray[i][j]]
             new_V[i][j] = ave((u, v), (height // 8, width // 8), tmp_cdf)
-    new_V = (new_V // SCALE).astype(np.uint8)
-    dst = hsv2bgr(img, new_V)
-    return dst
 
 
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+
     path = "./img/day-0.png"
     src = cv2.imread(path)[4:1084, 8:1928]
 
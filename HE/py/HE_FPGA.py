@@ -4,55 +4,153 @@
 # File Name:        HE_FPGA.py
 # Descriptions:     直方图均衡化（硬件思路验证）
 # -----------------------------------------README-----------------------------------------
-# 对硬件设计思路的验证，执行效率很低。
+# 对硬件设计思路的验证。`HE_loop`逐像素统计和映射，与RTL一一对应，执行效率很低；
+# `HE`拆分为`histogram`、`cdf_lut`、`apply_lut`三步整帧运算，结果逐位一致。
+# `HE_loop`的两个循环用`@jit`标记，设置ISP_JIT=1且安装了numba时编译执行（scripts/jit.py）。
+# 直方图可以隔行隔列取样（`stride`），误差见`scripts/substats.py`。
+# 一帧算出的查找表可以直接用于其他帧或裁剪区域，前级已经统计了直方图时（`raw2rgb_stats`）用`HE(img, stats)`。
 #
-# 可以对RGB彩图做处理：先转换到HSV空间，对V通道做处理，然后再还原回RGB。
+# 也可以输入N×H×W×3的多帧数据，每帧单独统计直方图（一次bincount完成），得到N×256的查找表。
+#
+# 可以对RGB彩图做处理：先转换到HSV空间，对V通道做处理，然后再用`scripts/hsv.py`的`rescale_v`还原回RGB。
+#
+# 视频序列用`HEVideo`：与he_core.v相同，用上一帧的映射表处理本帧，同时统计本帧直方图，
+# 按行块进行，每个像素只读一遍。第一帧没有映射表，原样输出。
+# smooth=k时直方图按`scripts/temporal.py`在帧间平滑，k=0时与RTL一致。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
 from time import time
+import sys
+sys.path.append("./scripts/")
+from hsv import rescale_v
+from temporal import smooth
+from jit import jit
 
 
+def histogram(img: np.ndarray, stride: int = 1) -> np.ndarray:
+    """统计V通道（三通道最大值）的256级直方图，多帧时每帧一个。
+    stride>1时每stride行、stride列取一个像素，计数按整帧与取样的像素数之比放大（向下取整），
+    总数不超过整帧像素数，cdf_lut的// 8192不变"""
+    if stride > 1:
+        sub = img[..., ::stride, ::stride, :]
+        return histogram(sub) * (img.shape[-3] * img.shape[-2]) // (sub.shape[-3] * sub.shape[-2])
+    gray = np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2])
+    frames = gray.shape[:-2]
+    if not frames:
+        return np.bincount(gray.ravel(), minlength=256)
+    num = np.prod(frames)
+    index = (np.arange(num, dtype=np.int32) << 8)[:, None] | gray.reshape(num, -1)
+    return np.bincount(index.ravel(), minlength=num * 256).reshape(frames + (256,))
+
+
+def cdf_lut(pdf: np.ndarray) -> np.ndarray:
+    """由直方图计算累积分布，得到V通道的映射表"""
+    return (pdf.cumsum(axis=-1) // 8192).astype(np.uint8)
+
+
+def apply_lut(img: np.ndarray, lut: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """用映射表对V通道做均衡化，再还原回RGB，结果写入out。多帧时lut可以是一张表，也可以每帧一张"""
+    gray = np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2])
+    if lut.ndim == 1:
+        return rescale_v(img, lut[gray], gray, out)
+    frames = gray.shape[:-2]
+    new_V = np.take_along_axis(lut.reshape(-1, 256), gray.reshape(np.prod(frames), -1), axis=-1)
+    return rescale_v(img, new_V.reshape(gray.shape), gray, out)
+
+
+def he_table(lut: np.ndarray) -> np.ndarray:
+    """把映射表和rescale_v合成为T[L, c]：V通道为L时通道值c的输出，形状为(..., 256, 256)"""
+    c = np.arange(256, dtype=np.uint32)
+    new_V = lut.astype(np.uint32)[..., :, None]
+    m = np.maximum(c, 1)[:, None]  # 与rescale_v相同，避免除零
+    return (c * new_V // m).clip(0, 255).astype(np.uint8)  # c不超过L，只有c>L的表项会被限幅
 
-def hsv2bgr(bgr: np.ndarray, new_V: np.ndarray):
-    tmp = bgr.astype(np.uint32) * new_V.astype(np.uint32)[:, :, None]
-    m = bgr.astype(np.uint32).max(axis=-1)[:, :, None]
-    m[m == 0] = 1  # 避免除零
-    dst = tmp / m
-    dst = dst.clip(0, 255).astype(np.uint8)
-    return dst
 
+def HE(img: np.ndarray, stats: dict = None, stride: int = 1):
+    """stats为raw2rgb_stats等前级已经统计好的量，有"hist"时不再统计直方图；stride为直方图的取样间隔"""
+    pdf = histogram(img, stride) if stats is None else stats["hist"]
+    return apply_lut(img, cdf_lut(pdf))
 
-def HE(img: np.ndarray):
+
+class HEVideo:
+    """视频模式的HE，push(band, last)与scripts/stream.py的各级接口相同"""
+
+    def __init__(self, smooth: int = 0, band: int = 64):
+        self.smooth = smooth
+        self.band = band
+        self.lut = None  # 上一帧的映射表
+        self.state = None  # 平滑后的直方图
+        self.pdf = np.zeros(256, dtype=np.int64)
+
+    def push(self, band: np.ndarray, last: bool, out: np.ndarray = None) -> np.ndarray:
+        """映射一个行块并统计它的直方图，last表示一帧的最后一块"""
+        gray = np.maximum(np.maximum(band[..., 0], band[..., 1]), band[..., 2])
+        self.pdf += np.bincount(gray.ravel(), minlength=256)
+        if out is None:
+            out = np.empty_like(band)
+        if self.lut is None:
+            np.copyto(out, band)
+        else:
+            rescale_v(band, self.lut[gray], gray, out)
+        if last:
+            self.state, pdf = smooth(self.state, self.pdf, self.smooth)
+            self.lut = cdf_lut(pdf)
+            self.pdf[:] = 0
+        return out
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """处理一帧，N×H×W×3时按顺序处理各帧"""
+        out = np.empty_like(img)
+        for frame, dst in zip(img, out) if img.ndim == 4 else [(img, out)]:
+            height = frame.shape[0]
+            for r0 in range(0, height, self.band):
+                r1 = min(r0 + self.band, height)
+                self.push(frame[r0:r1], r1 == height, dst[r0:r1])
+        return out
+
+
+def HE_loop(img: np.ndarray):
     gray = img.max(axis=-1)
-    height, width = gray.shape
-    pdf = np.zeros(256, dtype=int)
-    cdf = np.zeros(256)
+    pdf = np.zeros(256, dtype=np.int64)
     # 统计直方图分布
-    for i in range(height):
-        for j in range(width):
-            index = gray[i][j]
-            pdf[index] += 1
+    histogram_pixels(gray, pdf)
     # 计算累积分布直方图
     cdf = pdf.cumsum() // 8192
     cdf = cdf.astype(np.uint8)
 
     print("cdf done!")
 
-    new_V = np.ndarray(gray.shape)
+    new_V = np.empty(gray.shape, dtype=np.uint8)
     # 均衡化
+    equalize_pixels(gray, cdf, new_V)
+    dst = rescale_v(img, new_V, gray)
+    return dst
+
+
+@jit
+def histogram_pixels(gray, pdf):
+    height, width = gray.shape
+    for i in range(height):
+        for j in range(width):
+            index = gray[i][j]
+            pdf[index] += 1
+
+
+@jit
+def equalize_pixels(gray, cdf, new_V):
+    height, width = gray.shape
     for i in range(height):
         for j in range(width):
             new_V[i][j] = cdf[gray[i][j]]
-    dst = hsv2bgr(img, new_V)
-    return dst
 
 
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+
     path = "./img/day-0.png"
     src = cv2.imread(path)[4:1084, 8:1928]
 
@@ -4,23 +4,171 @@
 # File Name:        raw2rgb.py
 # Descriptions:     GBRG格式的RAW图像转为RGB格式
 # -----------------------------------------README-----------------------------------------
+# `raw2rgb`按GBRG的四种相位分别用跨步切片做整帧运算，结果与逐像素的`raw2rgb_loop`完全一致。
+# 设置ISP_JIT=1且安装了numba时，`raw2rgb_loop`的循环由scripts/jit.py编译执行，结果不变。
 #
+# 边界处理与RTL一致：左边、上边复制边缘像素，右边、下边回绕到另一侧。
+#
+# 也可以输入N×H×W的多帧数据，输出N×H×W×3。
+#
+# `raw2rgb_stats`按行块插值，趁每个行块还在缓存中时统计后级需要的量，返回(RGB, 统计量)：
+#   "sum"  ：各通道的和，按[b, g, r]排列，可以传给`AWB(img, stats)`
+#   "hist" ：V通道（三通道最大值）的直方图，可以传给`HE(img, stats)`
+#   "tiles"：按block×block分块的V通道直方图，与`CLAHE_FPGA.tile_histogram`相同，可以传给`CLAHE(img, block, stats)`
+# 统计只在crop=(上, 下, 左, 右)范围内进行，即后级实际处理的区域，后级不需要再扫描一遍整帧。
+# 统计量也可以取样得到（误差见`scripts/substats.py`）：`raw2rgb_stats`的`stride`隔行隔列取样，
+# `bin_stats`不插值，直接用GBRG的2x2单元统计。计数都按实际与取样的像素数之比放大，后级的归一化不需要修改。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
 import sys
 sys.path.append("./scripts/")
-from img_sim import create_img, gen_txt
+from jit import jit
+
+
+def demosaic(pad: np.ndarray, first_row: int = 0, out: np.ndarray = None) -> np.ndarray:
+    """对上下左右各扩展了一行/列的RAW数据做插值，first_row为输出第一行在整帧中的行号，结果写入out"""
+    height, width = pad.shape[-2] - 2, pad.shape[-1] - 2
+    pad = pad.astype(np.uint16)
+    dst = np.empty(pad.shape[:-2] + (height, width, 3), dtype=np.uint8) if out is None else out
+    for pi in range(2):
+        for pj in range(2):
+            # 当前相位在扩展图中的3x3邻域
+            def at(di, dj):
+                return pad[..., 1 + di + pi : 1 + di + height : 2, 1 + dj + pj : 1 + dj + width : 2]
+
+            out = dst[..., pi::2, pj::2, :]
+            phase = (first_row + pi) % 2
+            if phase == pj:  # G
+                h = (at(0, -1) + at(0, 1)) // 2
+                v = (at(-1, 0) + at(1, 0)) // 2
+                out[..., 1] = (at(-1, -1) + at(-1, 1) + at(0, 0) + at(1, -1) + at(1, 1)) // 5
+                out[..., 0], out[..., 2] = (h, v) if phase == 0 else (v, h)
+            else:  # R或B
+                out[..., 1] = (at(-1, 0) + at(0, -1) + at(0, 1) + at(1, 0)) // 4
+                out[..., 2 * phase] = at(0, 0)
+                out[..., 2 - 2 * phase] = (at(-1, -1) + at(-1, 1) + at(1, -1) + at(1, 1)) // 4
+    return dst
+
+
+def pad_cols(rows: np.ndarray) -> np.ndarray:
+    """左边复制第0列，右边回绕到第0列"""
+    width = rows.shape[-1]
+    return rows[..., np.r_[0, np.arange(width), 0]]
 
 
 def raw2rgb(img: np.ndarray) -> np.ndarray:
+    height = img.shape[-2]
+    # 扩展一圈边界：上、左取第0行/列（复制），下、右也取第0行/列（回绕）
+    rows = np.r_[0, np.arange(height), 0]
+    return demosaic(pad_cols(img[..., rows, :]))
+
+
+def tile_stats(rgb: np.ndarray, rows: np.ndarray, cols: np.ndarray, block: int, block_h: int, block_w: int):
+    """rgb各像素相对crop左上角的坐标为rows×cols，返回(通道和, 展平的块直方图)。
+    h、w不是block的整数倍时，余下的行列计入最后一块，直方图总数不变"""
+    gray = np.maximum(np.maximum(rgb[..., 0], rgb[..., 1]), rgb[..., 2])
+    row_num = np.minimum(rows // block_h, block - 1) * block
+    col_num = np.minimum(cols // block_w, block - 1)
+    index = ((row_num[:, None] + col_num) << 8) | gray
+    ch_sum = rgb.sum(axis=0, dtype=np.uint32).sum(axis=0, dtype=np.int64)
+    return ch_sum, np.bincount(index.ravel(), minlength=block * block * 256)
+
+
+def make_stats(ch_sum: np.ndarray, tiles: np.ndarray, crop, block: int) -> dict:
+    """由取样得到的通道和、块直方图生成统计量，计数按crop内（每块内）与取样的像素数之比放大，
+    总数不超过实际的像素数，后级的归一化不需要修改；没有取样时保持不变"""
+    top, bottom, left, right = crop
+    block_h = max((bottom - top) // block, 1)
+    block_w = max((right - left) // block, 1)
+    tile_rows = np.bincount(np.minimum(np.arange(bottom - top) // block_h, block - 1), minlength=block)
+    tile_cols = np.bincount(np.minimum(np.arange(right - left) // block_w, block - 1), minlength=block)
+    full = np.outer(tile_rows, tile_cols)
+    tiles = tiles.reshape(block, block, 256)
+    sampled = tiles.sum(axis=-1)
+    hist = tiles.sum(axis=(0, 1))
+    total, count = full.sum(), max(sampled.sum(), 1)
+    return {
+        "sum": ch_sum * total // count,
+        "hist": hist * total // count,
+        "tiles": tiles * full[..., None] // np.maximum(sampled, 1)[..., None],
+        "crop": crop,
+        "block": block,
+    }
+
+
+def stack_stats(results, block: int):
+    """多帧时把各帧的统计量堆叠起来"""
+    stats = {key: np.stack([s[key] for s in results]) for key in ("sum", "hist", "tiles")}
+    return dict(stats, crop=results[0]["crop"], block=block)
+
+
+def raw2rgb_stats(img: np.ndarray, crop=None, block: int = 8, band: int = 64, stride: int = 1):
+    """插值的同时统计crop范围内的通道和、V通道直方图和块直方图，返回(RGB, 统计量)。
+    stride>1时统计只取相对crop左上角为stride倍数的行列"""
+    if img.ndim > 2:  # 多帧时逐帧处理，统计量按帧堆叠
+        results = [raw2rgb_stats(frame, crop, block, band, stride) for frame in img]
+        return np.stack([dst for dst, _ in results]), stack_stats([s for _, s in results], block)
+    height, width = img.shape
+    top, bottom, left, right = crop or (0, height, 0, width)
+    pad = pad_cols(img[np.r_[0, np.arange(height), 0]])
+    dst = np.empty((height, width, 3), dtype=np.uint8)
+    block_h = max((bottom - top) // block, 1)
+    block_w = max((right - left) // block, 1)
+    cols = np.arange(0, right - left, stride, dtype=np.int32)
+    ch_sum = np.zeros(3, dtype=np.int64)
+    tiles = np.zeros(block * block * 256, dtype=np.int64)
+    for r0 in range(0, height, band):
+        r1 = min(r0 + band, height)
+        demosaic(pad[r0 : r1 + 2], r0, dst[r0:r1])
+        a = max(r0, top)
+        a += -(a - top) % stride  # 取样行按整帧坐标对齐，与行块的划分无关
+        b = min(r1, bottom)
+        if a >= b:
+            continue
+        rows = np.arange(a - top, b - top, stride, dtype=np.int32)
+        band_sum, band_tiles = tile_stats(dst[a:b:stride, left:right:stride], rows, cols, block, block_h, block_w)
+        ch_sum += band_sum
+        tiles += band_tiles
+    return dst, make_stats(ch_sum, tiles, (top, bottom, left, right), block)
+
+
+def bin_stats(img: np.ndarray, crop=None, block: int = 8) -> dict:
+    """不做插值，直接把GBRG的每个2x2单元合成一个像素（G取两个G的平均）来统计，
+    只统计完全落在crop内的2x2单元，每个单元代表四个像素"""
+    if img.ndim > 2:
+        return stack_stats([bin_stats(frame, crop, block) for frame in img], block)
+    height, width = img.shape
+    top, bottom, left, right = crop or (0, height, 0, width)
+    r0, c0 = top + top % 2, left + left % 2  # 2x2单元从偶数行列开始
+    quad = img[r0 : bottom - (bottom - r0) % 2, c0 : right - (right - c0) % 2]
+    rgb = np.empty((quad.shape[0] // 2, quad.shape[1] // 2, 3), dtype=np.uint8)
+    rgb[..., 0] = quad[0::2, 1::2]  # B
+    rgb[..., 1] = (quad[0::2, 0::2].astype(np.uint16) + quad[1::2, 1::2]) >> 1  # G
+    rgb[..., 2] = quad[1::2, 0::2]  # R
+    rows = np.arange(rgb.shape[0], dtype=np.int32) * 2 + (r0 - top)
+    cols = np.arange(rgb.shape[1], dtype=np.int32) * 2 + (c0 - left)
+    block_h = max((bottom - top) // block, 1)
+    block_w = max((right - left) // block, 1)
+    ch_sum, tiles = tile_stats(rgb, rows, cols, block, block_h, block_w)
+    return make_stats(ch_sum, tiles, (top, bottom, left, right), block)
+
+
+def raw2rgb_loop(img: np.ndarray) -> np.ndarray:
+    """逐像素实现，与RTL的数据通路一一对应"""
     img = img.astype(np.int32)
+    dst = np.empty(img.shape + (3,))
+    raw2rgb_pixels(img, dst)
+    dst = dst.astype(np.uint8)
+    return dst
+
+
+@jit
+def raw2rgb_pixels(img, dst):
     height, width = img.shape
-    dst = np.ndarray((height, width, 3))
     for i in range(height):
         for j in range(width):
             l = j - 1 if j > 0 else 0
@@ -43,11 +191,12 @@ def raw2rgb(img: np.ndarray) -> np.ndarray:
                 dst[i][j][0] = (img[u][j] + img[d][j]) / 2
                 dst[i][j][1] = (img[u][l] + img[u][r] + img[i][j] + img[d][l] + img[d][r]) / 5
                 dst[i][j][2] = (img[i][l] + img[i][r]) / 2
-    dst = dst.astype(np.uint8)
-    return dst
 
 
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+    from img_sim import create_img
+
     src = create_img("./img/raw_day_0.txt", (1088, 1936), 1)
     dst = raw2rgb(src)[4:1084, 8:1928]
 
@@ -37,6 +37,8 @@ GAMMA[:] = [0, 12, 17, 22, 25, 29, 32, 35, 37, 40, 42, 45, 47, 49, 51, 53,
 
 
 def Retinex(src: np.ndarray) -> np.ndarray:
+    if src.ndim == 4:  # 多帧数据逐帧处理
+        return np.stack([Retinex(frame) for frame in src])
     dst = np.ndarray(src.shape)
     L = src.max(2)
     L_ = GAMMA[L]
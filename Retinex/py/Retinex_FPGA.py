@@ -8,11 +8,17 @@
 #
 # 可以对RGB彩图做处理：先转换到HSV空间，对V通道做处理，然后再还原回RGB。
 #
+# 输出只取决于V通道L和通道值c，预先算出256x256的映射表，每个通道查一次表。
+#
+# 也可以输入N×H×W×3的多帧数据。
+#
+# 每个通道的输出随c单调不减，输出的V通道就是RETINEX_LUT[L, L]，所以前级统计的V通道直方图
+# （`raw2rgb_stats`）可以用`retinex_stats`直接换算成Retinex输出的直方图，供后面的HE、CLAHE使用。
+#
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
 from time import time
 
@@ -38,26 +44,38 @@ GAMMA[:] = [1, 12, 17, 22, 25, 29, 32, 35, 37, 40, 42, 45, 47, 49, 51, 53,
             248, 248, 249, 250, 250, 251, 251, 252, 252, 253, 253, 254, 255]
 
 
-def hsv2bgr(bgr: np.ndarray, new_V: np.ndarray):
-    tmp = bgr.astype(np.uint32) * new_V.astype(np.uint32)[:, :, None]
-    m = bgr.astype(np.uint32).max(axis=-1)[:, :, None]
-    m[m == 0] = 1  # 避免除零
-    dst = tmp / m
-    dst = dst.clip(0, 255).astype(np.uint8)
-    return dst
+def retinex_table() -> np.ndarray:
+    """Retinex的映射表，T[L, c]为V通道为L时通道值c的输出，与gamma.v中的查表对应"""
+    R = GAMMA.astype(np.uint16)  # 滤波对硬件开销较大，且3x3的核对最终结果影响较小，所以这里直接省略
+    tmp = (0xff00 // R).astype(np.uint32)
+    c = np.arange(256, dtype=np.uint32)
+    return (c[None, :] * tmp[:, None] // 256).clip(0, 255).astype(np.uint8)
+
+
+RETINEX_LUT = retinex_table()
 
 
 def Retinex(src: np.ndarray) -> np.ndarray:
-    L = src.max(axis=-1)
-    L_ = GAMMA[L]
-    R = L_.astype(np.uint16)  # 滤波对硬件开销较大，且3x3的核对最终结果影响较小，所以这里直接省略
-    tmp = (0xff00 // R).astype(np.uint32)
-    dst = (src.astype(np.uint32) * tmp[:, :, None]) // 256
-    dst = dst.clip(0, 255).astype(np.uint8)
+    L = np.maximum(np.maximum(src[..., 0], src[..., 1]), src[..., 2])
+    index = (L.astype(np.uint16) << 8)[..., None] | src  # 每个通道查一次表，代替逐像素的除法
+    return RETINEX_LUT.ravel()[index]
+
+
+def retinex_stats(stats: dict) -> dict:
+    """把Retinex输入的统计量换算为输出的统计量。通道和不能由直方图得到，不再保留"""
+    V = RETINEX_LUT[np.arange(256), np.arange(256)]
+    move = np.zeros((256, 256), dtype=np.int64)  # move[L, V[L]] = 1
+    move[np.arange(256), V] = 1
+    dst = {k: v for k, v in stats.items() if k not in ("sum", "hist", "tiles")}
+    for key in ("hist", "tiles"):
+        if key in stats:
+            dst[key] = stats[key] @ move
     return dst
 
 
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+
     path = "./img/day-0.png"
     src = cv2.imread(path)[4:1084, 8:1928]
 
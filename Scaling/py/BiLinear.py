@@ -8,6 +8,9 @@
 # 
 # 坐标映射策略：将目标图像四个角的像素点坐标映射到源图像的四个角上。
 #
+# 行、列的源坐标和权重只计算一次，先竖直后水平分两步插值，支持放大和缩小，支持单通道和三通道图像。
+# 也可以输入N×H×W×C的多帧数据；N×H×W的多帧灰度图需要stack=True，否则与H×W×C无法区分，最后一维不是1、3、4时报错。
+#
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
@@ -17,38 +20,40 @@ import numpy as np
 from time import time
 
 
-def bi_linear(src: np.ndarray, target_size) -> np.ndarray:
+def axis_table(src_len: int, dst_len: int):
+    """沿一个方向计算目标坐标对应的两个源坐标和小数权重"""
+    idx = np.arange(dst_len)
+    src_x = idx * (src_len - 1) / (dst_len - 1)
+    num = src_x.astype(np.int64)
+    weight = src_x - num
+    edge = (idx == 0) | (idx == dst_len - 1)
+    num_next = np.where(edge, num, num + 1)
+    return num, num_next, weight
+
+
+def row_axis(src: np.ndarray, stack: bool = False) -> int:
+    """行所在的维度：单帧（H×W或H×W×C）为0，多帧（stack=True时的N×H×W，或N×H×W×C）为1"""
+    if stack or src.ndim == 4:
+        if src.ndim not in (3, 4):
+            raise ValueError(f"stack=True expects N×H×W or N×H×W×C input, got shape {src.shape}")
+        return 1
+    if src.ndim == 3 and src.shape[-1] not in (1, 3, 4):
+        raise ValueError(f"ambiguous input shape {src.shape}: H×W×C needs C in (1, 3, 4), pass stack=True for N×H×W gray frames")
+    return 0
+
+
+def bi_linear(src: np.ndarray, target_size, stack: bool = False) -> np.ndarray:
     dst_h, dst_w = target_size[0], target_size[1]
-    dst = np.zeros(target_size)
-    src_h = src.shape[0]
-    src_w = src.shape[1]
-    addr = [0, 0, 0, 0]
-    tmp_mul = [0, 0]
-    for i in range(dst_h):
-        for j in range(dst_w):
-            src_x = i * (src_h - 1) / (dst_h - 1)
-            src_y = j * (src_w - 1) / (dst_w - 1)
-            num_i = int(src_x)
-            num_j = int(src_y)
-            u = src_y - num_j
-            v = src_x - num_i
-            flag_u_d = (i == 0) or (i == dst_h - 1)
-            flag_l_r = (j == 0) or (j == dst_w - 1)
-            addr[0] = (num_i, num_j)
-            addr[1] = (addr[0][0], addr[0][1] if (flag_l_r) else addr[0][1] + 1)
-            addr[2] = (addr[0][0] if (flag_u_d) else addr[0][0] + 1, addr[0][1])
-            addr[3] = (addr[1][0] if (flag_u_d) else addr[1][0] + 1, addr[1][1])
-            try:
-                tmp_src_0 = src[addr[0][0]][addr[0][1]].astype(np.int32)
-                tmp_src_1 = src[addr[1][0]][addr[1][1]].astype(np.int32)
-                tmp_src_2 = src[addr[2][0]][addr[2][1]].astype(np.int32)
-                tmp_src_3 = src[addr[3][0]][addr[3][1]].astype(np.int32)
-            except Exception as e:
-                print(addr)
-                raise e
-            tmp_mul[0] = (1 - v) * tmp_src_0 + v * tmp_src_2
-            tmp_mul[1] = (1 - v) * tmp_src_1 + v * tmp_src_3
-            dst[i][j] = (1 - u) * tmp_mul[0] + u * tmp_mul[1]
+    axis = row_axis(src, stack)
+    num_i, next_i, v = axis_table(src.shape[axis], dst_h)
+    num_j, next_j, u = axis_table(src.shape[axis + 1], dst_w)
+    extra = (None,) * (src.ndim - axis - 2)
+    v = v[(slice(None), None) + extra]
+    u = u[(slice(None),) + extra]
+    img = src.astype(np.int32)
+    # 先沿竖直方向插值（每个源列只算一次），再沿水平方向插值
+    tmp_mul = (1 - v) * img.take(num_i, axis) + v * img.take(next_i, axis)
+    dst = (1 - u) * tmp_mul.take(num_j, axis + 1) + u * tmp_mul.take(next_j, axis + 1)
     dst = dst.astype(np.uint8)
     return dst
 
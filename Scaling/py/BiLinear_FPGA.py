@@ -4,28 +4,108 @@
 # File Name:        BiLinear_FPGA.py
 # Descriptions:     双线性插值算法实现图像缩放（硬件思路验证）
 # -----------------------------------------README-----------------------------------------
-# 对硬件设计思路的验证，执行效率很低。
-# 
-# 对RGB三个通道分别做双线性插值。
+# 对硬件设计思路的验证。`bi_linear_loop`逐像素计算地址和权重，与RTL一一对应，执行效率很低；
+# `bi_linear`按(源尺寸, 目标尺寸, 缩放倍数)缓存每行、每列的地址和权重表，整帧做定点插值，结果逐位一致。
+# `interpolate`也可以只取表中的一段，scripts/roi.py用它只计算目标区域。
+# `bi_linear_loop`的地址计算在`bi_linear_pixels`中，ISP_JIT=1时由numba编译（scripts/jit.py）。
+#
+# 对RGB三个通道分别做双线性插值。也可以输入N×H×W×C的多帧数据；N×H×W的多帧灰度图需要stack=True，
+# 否则与H×W×C无法区分，最后一维不是1、3、4时报错。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
 import numpy as np
+from functools import lru_cache
 from time import time
+import sys
+sys.path.append("./scripts/")
+from jit import jit
+
+
+def axis_table(length: int, scale_len: int, src_len: int):
+    """沿一个方向计算目标坐标对应的两个源地址和权重（坐标放大8倍表示）"""
+    new_idx = 8 * np.arange(length, dtype=np.int32)
+    block_idx = new_idx // scale_len
+    flag = new_idx % scale_len < scale_len // 2
+    num = np.where(block_idx == 0, 0, block_idx - flag)
+    edge = ((block_idx == 0) & flag) | ((block_idx == src_len - 1) & ~flag)
+    num_next = np.where(edge, num, num + 1)
+    weight = new_idx - (num * scale_len + scale_len // 2)
+    return num, num_next, weight
+
+
+def max_size(src_shape, scale: float):
+    """源尺寸按scale放大后能得到的最大目标尺寸：目标坐标所在的源块不能超出源图像"""
+    scale_len = int(8 * scale)
+    return tuple(-(-src_len * scale_len // 8) for src_len in src_shape[:2])
+
+
+@lru_cache(maxsize=32)
+def scale_table(src_shape, target_size, scale: float):
+    """预计算并缓存行、列方向的地址和权重表"""
+    limit = max_size(src_shape, scale)
+    if target_size[0] > limit[0] or target_size[1] > limit[1]:
+        raise ValueError(
+            f"target size {tuple(target_size[:2])} is too large for a {tuple(src_shape[:2])} source at scale {scale}, "
+            f"at most {limit}"
+        )
+    scale_h = int(8 * scale)
+    scale_w = int(8 * scale)
+    rows = axis_table(target_size[0], scale_h, src_shape[0])
+    cols = axis_table(target_size[1], scale_w, src_shape[1])
+    return rows, cols
 
 
-def bi_linear(src: np.ndarray, scale: float) -> np.ndarray:
-    th, tw = 1080, 1920  # int(scale * src.shape[0]), int(scale * src.shape[1])
-    dst = np.zeros((th, tw, 3))
+def row_axis(src: np.ndarray, stack: bool = False) -> int:
+    """行所在的维度：单帧（H×W或H×W×C）为0，多帧（stack=True时的N×H×W，或N×H×W×C）为1"""
+    if stack or src.ndim == 4:
+        if src.ndim not in (3, 4):
+            raise ValueError(f"stack=True expects N×H×W or N×H×W×C input, got shape {src.shape}")
+        return 1
+    if src.ndim == 3 and src.shape[-1] not in (1, 3, 4):
+        raise ValueError(f"ambiguous input shape {src.shape}: H×W×C needs C in (1, 3, 4), pass stack=True for N×H×W gray frames")
+    return 0
+
+
+def interpolate(src: np.ndarray, rows, cols, scale: float, axis: int = 0) -> np.ndarray:
+    """按行、列的(地址, 下一地址, 权重)表做定点插值，表可以只是scale_table中的一段，axis为行所在的维度"""
     scale_h = int(8 * scale)
     scale_w = int(8 * scale)
-    addr = [0, 0, 0, 0]
-    tmp_mul = [0, 0]
     SCALE = scale_h * scale_w // 256
-    test = set()
+    (num_i, next_i, v), (num_j, next_j, u) = rows, cols
+    extra = (None,) * (src.ndim - axis - 2)
+    v = v[(slice(None), None) + extra]
+    u = u[(slice(None),) + extra]
+    img = src.astype(np.int32)
+    # 先做上下插值（每个源列只算一次），再按列地址做左右插值
+    tmp_mul = ((scale_h - v) * img.take(num_i, axis) + v * img.take(next_i, axis)) // 256
+    dst = ((scale_w - u) * tmp_mul.take(num_j, axis + 1) + u * tmp_mul.take(next_j, axis + 1)) // SCALE
+    dst = dst.astype(np.uint8)
+    return dst
+
+
+def bi_linear(src: np.ndarray, scale: float, target_size=(1080, 1920), stack: bool = False) -> np.ndarray:
+    axis = row_axis(src, stack)
+    rows, cols = scale_table(src.shape[axis : axis + 2], tuple(target_size[:2]), scale)
+    return interpolate(src, rows, cols, scale, axis)
+
+
+def bi_linear_loop(src: np.ndarray, scale: float, target_size=(1080, 1920)) -> np.ndarray:
+    th, tw = target_size[0], target_size[1]
+    img = src.astype(np.int32).reshape(src.shape[:2] + (-1,))  # 单通道也按H×W×1处理
+    dst = np.zeros((th, tw, img.shape[2]))
+    bi_linear_pixels(img, int(8 * scale), int(8 * scale), dst)
+    dst = dst.reshape((th, tw) + src.shape[2:]).astype(np.uint8)
+    return dst
+
+
+@jit
+def bi_linear_pixels(src, scale_h, scale_w, dst):
+    th, tw = dst.shape[0], dst.shape[1]
+    addr = [(0, 0), (0, 0), (0, 0), (0, 0)]
+    SCALE = scale_h * scale_w // 256
     for i in range(th):
         for j in range(tw):
             new_i = 8 * i
@@ -47,21 +127,20 @@ def bi_linear(src: np.ndarray, scale: float) -> np.ndarray:
             u = new_j - (addr[0][1] * scale_w + scale_w // 2)
             v = new_i - (addr[0][0] * scale_h + scale_h // 2)
 
-            tmp_src_0 = src[addr[0][0]][addr[0][1]].astype(np.int32)
-            tmp_src_1 = src[addr[1][0]][addr[1][1]].astype(np.int32)
-            tmp_src_2 = src[addr[2][0]][addr[2][1]].astype(np.int32)
-            tmp_src_3 = src[addr[3][0]][addr[3][1]].astype(np.int32)
-            # print(tmp_src_0, tmp_src_1, tmp_src_2, tmp_src_3)
-            tmp_mul[0] = (scale_h - v) * tmp_src_0 + v * tmp_src_2
-            tmp_mul[1] = (scale_h - v) * tmp_src_1 + v * tmp_src_3
-            tmp = (scale_w - u) * (tmp_mul[0] // 256) + u * (tmp_mul[1] // 256)
-            dst[i][j] = tmp // SCALE
-            test.add(num_i)
-    dst = dst.astype(np.uint8)
-    return dst
+            for c in range(src.shape[2]):
+                tmp_src_0 = src[addr[0][0]][addr[0][1]][c]
+                tmp_src_1 = src[addr[1][0]][addr[1][1]][c]
+                tmp_src_2 = src[addr[2][0]][addr[2][1]][c]
+                tmp_src_3 = src[addr[3][0]][addr[3][1]][c]
+                tmp_mul_0 = (scale_h - v) * tmp_src_0 + v * tmp_src_2
+                tmp_mul_1 = (scale_h - v) * tmp_src_1 + v * tmp_src_3
+                tmp = (scale_w - u) * (tmp_mul_0 // 256) + u * (tmp_mul_1 // 256)
+                dst[i][j][c] = tmp // SCALE
 
 
 if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV，整帧运算不依赖它
+
     path = "./img/day-0.png"
     src = cv2.imread(path)[273:813, 487:1447]
     scale = 2
@@ -16,6 +16,8 @@ from time import time
 
 
 def Sobel(src: np.ndarray):
+    if src.ndim == 4:  # 多帧数据逐帧处理
+        return np.stack([Sobel(frame) for frame in src])
     gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
     # 计算水平和垂直方向的梯度
     grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
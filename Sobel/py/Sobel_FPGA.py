@@ -0,0 +1,110 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        Sobel_FPGA.py
+# Descriptions:     Sobel边缘检测算法（硬件思路验证）
+# -----------------------------------------README-----------------------------------------
+# `Sobel_loop`逐像素计算，与RTL一一对应，执行效率很低；`Sobel`整帧计算，与RTL逐位一致：
+#   rgb2gray.v ：gray = (27 * B + 150 * G + 77 * R) >> 8
+#   block_3x3.v：3x3窗口，图像边界复制临近的值
+#   sobel.v    ：int16梯度，grad = |gx| + |gy|存在10bits寄存器中（超过1023时回绕），
+#                高两位不为0时输出255
+# `Sobel_loop`的循环用`@jit`标记，ISP_JIT=1且安装了numba时编译执行（scripts/jit.py）。
+#
+# `mode="sqrt"`时输出floor(sqrt(gx^2 + gy^2))，超过255时限幅，用于和软件的Sobel对比。
+#
+# 也可以输入N×H×W×3的多帧数据；按行分块时用`Sobel_rows`，需要上下各一行的邻域。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import cv2
+import numpy as np
+from time import time
+import sys
+sys.path.append("./scripts/")
+from jit import jit
+
+
+def rgb2gray(src: np.ndarray) -> np.ndarray:
+    """与rgb2gray.v一致的灰度转换，乘积和不超过16bits"""
+    tmp = src[..., 0] * np.uint16(27)
+    tmp += src[..., 1] * np.uint16(150)
+    tmp += src[..., 2] * np.uint16(77)
+    return (tmp >> 8).astype(np.uint8)
+
+
+def gradient(gray: np.ndarray, mode: str = "abs") -> np.ndarray:
+    """对单帧灰度图计算梯度幅值"""
+    grad_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    grad_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    if mode == "abs":
+        grad = (np.abs(grad_x) + np.abs(grad_y)) & 0x3FF  # grad_data只有10bits
+    elif mode == "sqrt":
+        grad = np.sqrt(grad_x.astype(np.int32) ** 2 + grad_y.astype(np.int32) ** 2).astype(np.int32)  # 不超过21bits，浮点开方取整是精确的
+    else:
+        raise ValueError(f"unknown mode: {mode}")
+    return np.minimum(grad, 255).astype(np.uint8)
+
+
+def Sobel(src: np.ndarray, mode: str = "abs") -> np.ndarray:
+    gray = rgb2gray(src)
+    if gray.ndim == 3:  # 多帧数据逐帧计算梯度
+        return np.stack([gradient(frame, mode) for frame in gray])
+    return gradient(gray, mode)
+
+
+def Sobel_rows(src: np.ndarray, r0: int, r1: int, mode: str = "abs") -> np.ndarray:
+    """由整帧输入计算输出的第r0到r1行，只读取上下各一行的邻域，与整帧计算的结果一致"""
+    top = max(r0 - 1, 0)
+    dst = Sobel(src[..., top : min(r1 + 1, src.shape[-3]), :, :], mode)
+    return dst[..., r0 - top : r1 - top, :]
+
+
+def Sobel_loop(src: np.ndarray) -> np.ndarray:
+    height, width = src.shape[:2]
+    gray = np.empty((height, width), dtype=np.uint8)
+    gray_pixels(src, gray)
+    dst = np.empty((height, width), dtype=np.uint8)
+    sobel_pixels(gray, dst)
+    return dst
+
+
+@jit
+def gray_pixels(src, gray):
+    height, width = gray.shape
+    for i in range(height):
+        for j in range(width):
+            b, g, r = int(src[i][j][0]), int(src[i][j][1]), int(src[i][j][2])
+            gray[i][j] = (b * 27 + g * 150 + r * 77) >> 8
+
+
+@jit
+def sobel_pixels(gray, dst):
+    height, width = gray.shape
+    for i in range(height):
+        rows = [max(i - 1, 0), i, min(i + 1, height - 1)]  # 边界复制临近的值
+        for j in range(width):
+            cols = [max(j - 1, 0), j, min(j + 1, width - 1)]
+            block = [[int(gray[y][x]) for x in cols] for y in rows]
+            gradx_tmp = [block[0][0] + 2 * block[1][0] + block[2][0], block[0][2] + 2 * block[1][2] + block[2][2]]
+            grady_tmp = [block[0][0] + 2 * block[0][1] + block[0][2], block[2][0] + 2 * block[2][1] + block[2][2]]
+            gradx = abs(gradx_tmp[0] - gradx_tmp[1])
+            grady = abs(grady_tmp[0] - grady_tmp[1])
+            grad = (gradx + grady) & 0x3FF
+            dst[i][j] = 0xFF if grad >> 8 else grad
+
+
+if __name__ == "__main__":
+    path = "./img/night-0.png"
+    src = cv2.imread(path)[4:1084, 8:1928]
+
+    start = time()
+    dst = Sobel(src)
+    print(f"Running time = {time()-start}s")
+
+    cv2.imshow("src", cv2.resize(src, (960, 540)))
+    cv2.imshow("dst", cv2.resize(dst, (960, 540)))
+    cv2.waitKey()
+    cv2.destroyAllWindows()
@@ -0,0 +1,14 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        __init__.py
+# Descriptions:     ISP算法的命令行入口
+# -----------------------------------------README-----------------------------------------
+# 各算法模块仍在各自的`*/py/`目录下，用到时才导入（见`stages.py`），
+# 导入本包本身不加载numpy和OpenCV。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+__version__ = "0.1.0"
@@ -0,0 +1,3 @@
+from isp.cli import main
+
+main()
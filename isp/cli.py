@@ -0,0 +1,222 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        cli.py
+# Descriptions:     不依赖显示的命令行工具
+# -----------------------------------------README-----------------------------------------
+#   isp stages
+#   isp run --stages raw2rgb,crop,retinex,he,awb --in img/raw_day_0.txt --out day.png
+#   isp run --stages retinex,he --in seq.frames --out out.frames
+#
+# 输入输出按扩展名区分：
+#   .png/.jpg/.bmp：OpenCV读写
+#   .npy          ：numpy数组，N×H×W(×3)时按多帧处理
+#   .txt          ：img_sim的仿真数据格式，需要--shape，RAW为单通道
+#   .frames       ：scripts/frames.py的多帧文件，逐帧处理，crop默认使用文件头中的有效区域
+# 多帧输出到图片时，文件名中的`{}`替换为帧号。
+#
+# 只有用到的算法模块和OpenCV才会被导入，`isp stages`不加载numpy。
+# `--video`时HE、CLAHE、AWB按视频模式处理多帧输入：用上一帧的统计量处理本帧（与RTL相同），
+# 第一帧原样输出，`--smooth k`对统计量做帧间平滑。
+# `--trace trace.json`时用scripts/tracing.py记录每一级及其内部各阶段的耗时和内存：
+# 每一级（包括crop和视频模式的实例）记为`stage.<名称>`，其中调用的模块函数嵌套在下面。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import sys
+import argparse
+from time import perf_counter
+
+from isp import __version__
+from isp.stages import STAGES, VIDEO, add_path, load, load_video
+
+IMAGE_EXT = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def parse_ints(text: str):
+    return tuple(int(v) for v in text.split(","))
+
+
+def read_frames(path: str, args):
+    """产生(帧, 头信息中的crop)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXT:
+        import cv2
+
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise SystemExit(f"cannot read {path}")
+        yield img, None
+    elif ext == ".npy":
+        import numpy as np
+
+        data = np.load(path, mmap_mode="r")
+        frames = data if data.ndim == 4 or (data.ndim == 3 and data.shape[-1] != 3) else [data]
+        for frame in frames:
+            yield np.asarray(frame), None
+    elif ext == ".txt":
+        add_path("scripts")
+        from img_sim import create_img
+
+        yield create_img(path, parse_ints(args.shape), args.channel), None
+    elif ext == ".frames":
+        add_path("scripts")
+        from frames import FrameStore
+
+        store = FrameStore(path)
+        index = range(len(store))
+        if args.frames:
+            index = index[slice(*(int(v) if v else None for v in args.frames.split(":")))]
+        for n in index:
+            yield store[n], store.header.get("crop")
+    else:
+        raise SystemExit(f"unsupported input format: {path}")
+
+
+class Writer:
+    """按扩展名写出结果，多帧时逐帧追加"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ext = os.path.splitext(path)[1].lower()
+        self.count = 0
+        self.frames = []  # .npy需要在最后一次写出
+        self.store = None
+
+    def write(self, img):
+        ext = self.ext
+        if ext in IMAGE_EXT:
+            import cv2
+
+            path = self.path.format(self.count) if "{}" in self.path else self.path
+            cv2.imwrite(path, img)
+        elif ext == ".npy":
+            self.frames.append(img)
+        elif ext == ".txt":
+            add_path("scripts")
+            from img_sim import gen_txt
+
+            # 多帧连续写入同一个txt，与仿真输出的格式相同
+            tmp = self.path + ".part"
+            gen_txt(img, tmp)
+            with open(self.path, "ab" if self.count else "wb") as f, open(tmp, "rb") as part:
+                f.write(part.read())
+            os.remove(tmp)
+        elif ext == ".frames":
+            if self.store is None:
+                add_path("scripts")
+                from frames import FrameWriter
+
+                self.store = FrameWriter(self.path, img.shape, 1 if img.ndim == 2 else img.shape[2])
+            self.store.append(img)
+        else:
+            raise SystemExit(f"unsupported output format: {self.path}")
+        self.count += 1
+
+    def close(self):
+        if self.frames:
+            import numpy as np
+
+            np.save(self.path, self.frames[0] if len(self.frames) == 1 else np.stack(self.frames))
+        if self.store is not None:
+            self.store.close()
+
+
+def load_stage(name: str, tracer=None):
+    stage = load(name)
+    if tracer is not None:  # 替换模块中的函数后重新取出包装过的版本
+        tracer.instrument(sys.modules[stage.__module__])
+        stage = load(name)
+    return stage
+
+
+def build_chain(args, tracer=None):
+    """把--stages转换为函数列表，crop和scale带参数；有tracer时每一级记录为一个span"""
+    chain = []
+    for name in args.stages.split(","):
+        name = name.strip()
+        if name == "crop":
+            crop = parse_ints(args.crop) if args.crop else None
+
+            def func(img, header_crop, crop=crop):
+                top, bottom, left, right = crop or header_crop or (3, 1083, 7, 1927)  # RAW插值后的有效区域
+                return img[top:bottom, left:right]
+
+            chain.append(func)
+        elif name == "scale":
+            stage = load_stage(name, tracer)
+            size = parse_ints(args.size)
+            chain.append(lambda img, header_crop, stage=stage: stage(img, args.scale, size))
+        elif args.video and name in VIDEO:
+            load_stage(name, tracer)
+            stage = load_video(name, args.smooth)
+            chain.append(lambda img, header_crop, stage=stage: stage(img))
+        else:
+            stage = load_stage(name, tracer)
+            chain.append(lambda img, header_crop, stage=stage: stage(img))
+        if tracer is not None:
+            chain[-1] = tracer.wrap(chain[-1], f"stage.{name}")
+    return chain
+
+
+def run(args):
+    start = perf_counter()
+    tracer = None
+    if args.trace:
+        add_path("scripts")
+        from tracing import Tracer
+
+        tracer = Tracer().__enter__()
+    chain = build_chain(args, tracer)
+    writer = Writer(args.out)
+    try:
+        for img, header_crop in read_frames(args.input, args):
+            for func in chain:
+                img = func(img, header_crop)
+            writer.write(img)
+    finally:
+        writer.close()
+        if tracer is not None:
+            tracer.__exit__(None, None, None)
+            tracer.save_chrome(args.trace)
+            print(tracer.report(), file=sys.stderr)
+    print(f"{writer.count} frame(s) -> {args.out} in {perf_counter() - start:.3f}s", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="isp", description="ISP algorithm models")
+    parser.add_argument("--version", action="version", version=__version__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stages", help="list available stages")
+    p = sub.add_parser("run", help="run a chain of stages on an image or frame sequence")
+    p.add_argument("--stages", required=True, help="comma separated, e.g. raw2rgb,crop,retinex,he,awb")
+    p.add_argument("--in", dest="input", required=True)
+    p.add_argument("--out", required=True)
+    p.add_argument("--shape", default="1088,1936", help="h,w of .txt input")
+    p.add_argument("--channel", type=int, default=1, help="channels of .txt input")
+    p.add_argument("--frames", default=None, help="start:stop of .frames input")
+    p.add_argument("--crop", default=None, help="top,bottom,left,right, default: .frames header or 3,1083,7,1927")
+    p.add_argument("--scale", type=float, default=2)
+    p.add_argument("--size", default="1080,1920", help="h,w of scale output")
+    p.add_argument("--video", action="store_true", help="he/clahe/awb use the previous frame's statistics")
+    p.add_argument("--smooth", type=int, default=0, help="temporal smoothing of --video statistics, 0 = off")
+    p.add_argument("--trace", default=None, help="record per-stage time and memory as a Chrome trace")
+    args = parser.parse_args(argv)
+
+    if args.command == "stages":
+        for name, (_, module, func, text) in STAGES.items():
+            print(f"{name:8} {module + '.' + func:24} {text}")
+        print(f"{'crop':8} {'':24} --crop top,bottom,left,right")
+    else:
+        # 在导入任何模块之前检查级名，未知的名称按用法错误退出（返回2）
+        unknown = [name.strip() for name in args.stages.split(",") if name.strip() not in STAGES and name.strip() != "crop"]
+        if unknown:
+            p.error(f"unknown stage(s): {', '.join(map(repr, unknown))}, choose from {', '.join(STAGES)}, crop")
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
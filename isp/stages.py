@@ -0,0 +1,70 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        stages.py
+# Descriptions:     按名称延迟加载算法模块
+# -----------------------------------------README-----------------------------------------
+# 各模块按绝对路径加入搜索路径后再导入，与当前工作目录无关。
+# `pip install .`时各目录装在isp包下（isp/HE、isp/scripts等，见pyproject.toml），
+# 可编辑安装或直接在源码目录中运行时使用源码目录（HE/py、scripts等）。
+# 只有`load`时才导入对应的模块（以及它依赖的numpy）。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import sys
+import importlib
+
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(PACKAGE)
+
+# 名称: (目录, 模块, 函数, 说明)
+STAGES = {
+    "raw2rgb": ("Raw2rgb/py", "raw2rgb", "raw2rgb", "GBRG RAW -> BGR"),
+    "retinex": ("Retinex/py", "Retinex_FPGA", "Retinex", "Retinex (hardware model)"),
+    "he": ("HE/py", "HE_FPGA", "HE", "histogram equalization"),
+    "clahe": ("CLAHE/py", "CLAHE_FPGA", "CLAHE", "CLAHE, h and w must be multiples of 8"),
+    "awb": ("AWB/py", "AWB_FPGA", "AWB", "gray-world white balance"),
+    "scale": ("Scaling/py", "BiLinear_FPGA", "bi_linear", "bilinear upscaling, see --scale/--size"),
+    "sobel": ("Sobel/py", "Sobel_FPGA", "Sobel", "Sobel edges (bit-accurate with sobel.v)"),
+}
+
+# 视频模式：用上一帧的统计量处理本帧（名称: 类）
+VIDEO = {"he": "HEVideo", "clahe": "CLAHEVideo", "awb": "AWBVideo"}
+
+
+def locate(directory: str) -> str:
+    """返回目录的绝对路径：先找安装在isp包下的副本，再找源码目录"""
+    for path in (os.path.join(PACKAGE, directory.split("/")[0]), os.path.join(ROOT, directory)):
+        if os.path.isdir(path):
+            return path
+    raise ModuleNotFoundError(
+        f"stage modules not found ({directory}); install the isp package from the repository "
+        "with `pip install .` or `pip install -e .`"
+    )
+
+
+def add_path(directory: str):
+    path = locate(directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load(name: str):
+    """导入并返回名为name的算法函数"""
+    if name not in STAGES:
+        raise KeyError(f"unknown stage '{name}', choose from {', '.join(STAGES)}")
+    directory, module, func, _ = STAGES[name]
+    add_path("scripts")  # hsv.py、img_sim.py等公共模块
+    add_path(directory)
+    return getattr(importlib.import_module(module), func)
+
+
+def load_video(name: str, smooth: int = 0):
+    """返回名为name的视频模式实例，逐帧调用时保存帧间的统计量"""
+    if name not in VIDEO:
+        raise KeyError(f"stage '{name}' has no video mode, choose from {', '.join(VIDEO)}")
+    module = sys.modules[load(name).__module__]
+    return getattr(module, VIDEO[name])(smooth=smooth)
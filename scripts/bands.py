@@ -0,0 +1,152 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        bands.py
+# Descriptions:     按行分块的多线程并行执行
+# -----------------------------------------README-----------------------------------------
+# 把一帧按行切成若干块，每一级在线程池里并行处理各块，各级之间同步一次。
+# 块内运算都是numpy/OpenCV的整块运算，计算时会释放GIL。
+#
+# 每块从整帧输入中读取自己需要的行，包括上下的邻域（halo）：
+#   raw2rgb：上一行（第0行复制）和下一行（最后一行回绕到第0行）
+#   Sobel  ：上下各一行，图像边界处与整帧处理一样由OpenCV做镜像（Sobel_FPGA为复制）
+# 需要整帧统计量的级（HE、CLAHE、AWB）先并行统计各块，累加后得到参数，再并行映射。
+# 裁剪等普通函数也可以放进级联，按整帧执行。
+# 结果与单线程整帧处理逐字节一致。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+import sys
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./CLAHE/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Retinex/py/")
+sys.path.append("./Sobel/py/")
+
+import raw2rgb
+import CLAHE_FPGA
+import HE_FPGA
+import AWB_FPGA
+import Retinex_FPGA
+import Sobel
+import Sobel_FPGA
+
+from img_sim import create_img
+
+
+class BandStage:
+    """按行分块执行的一级。
+
+    band(img, r0, r1, param)  由整帧输入img计算输出的第r0到r1行
+    stats(img, r0, r1)        统计第r0到r1行的统计量，各块结果可以直接相加
+    finalize(total, img)      由整帧统计量得到band用的参数
+    """
+
+    def __init__(self, band, stats=None, finalize=None):
+        self.band = band
+        self.stats = stats
+        self.finalize = finalize
+
+
+def point(func):
+    """逐像素运算，不需要邻域"""
+    return BandStage(lambda img, r0, r1, param: func(img[r0:r1]))
+
+
+def _raw2rgb(img, r0, r1, param):
+    height = img.shape[0]
+    rows = np.r_[max(r0 - 1, 0), r0:r1, r1 % height]
+    return raw2rgb.demosaic(raw2rgb.pad_cols(img[rows]), r0)
+
+
+def _sobel(img, r0, r1, param):
+    top = max(r0 - 1, 0)
+    dst = Sobel.Sobel(img[top : min(r1 + 1, img.shape[0])])
+    return dst[r0 - top : r1 - top]
+
+
+def clahe(block: int = 8):
+    def gray(img, r0, r1):
+        return np.maximum(np.maximum(img[r0:r1, :, 0], img[r0:r1, :, 1]), img[r0:r1, :, 2])
+
+    def finalize(pdf, img):
+        height, width = img.shape[:2]
+        return CLAHE_FPGA.tile_cdf(pdf, (height // block) * (width // block))
+
+    return BandStage(
+        lambda img, r0, r1, cdf: CLAHE_FPGA.tile_apply(img[r0:r1], cdf, img.shape[0], r0),
+        lambda img, r0, r1: CLAHE_FPGA.tile_histogram(gray(img, r0, r1), block, img.shape[0], r0),
+        finalize,
+    )
+
+
+RAW2RGB = BandStage(_raw2rgb)
+RETINEX = point(Retinex_FPGA.Retinex)
+HE = BandStage(
+    lambda img, r0, r1, lut: HE_FPGA.apply_lut(img[r0:r1], lut),
+    lambda img, r0, r1: HE_FPGA.histogram(img[r0:r1]),
+    lambda pdf, img: HE_FPGA.cdf_lut(pdf),
+)
+CLAHE = clahe()
+AWB = BandStage(
+    lambda img, r0, r1, mean: AWB_FPGA.apply_gain(img[r0:r1], mean),
+    lambda img, r0, r1: AWB_FPGA.channel_sum(img[r0:r1]),
+    lambda total, img: AWB_FPGA.sum2mean(total),
+)
+SOBEL = BandStage(_sobel)
+SOBEL_FPGA = BandStage(lambda img, r0, r1, param: Sobel_FPGA.Sobel_rows(img, r0, r1))
+
+
+class BandExecutor:
+    def __init__(self, stages, workers: int = None, bands: int = None):
+        self.stages = stages
+        self.workers = workers or os.cpu_count()
+        self.bands = bands or 2 * self.workers
+        self.pool = ThreadPoolExecutor(self.workers)
+
+    def split(self, height: int):
+        edge = np.linspace(0, height, min(self.bands, height) + 1).astype(int)
+        return list(zip(edge[:-1], edge[1:]))
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        for stage in self.stages:
+            if not isinstance(stage, BandStage):  # 裁剪等整帧操作直接执行
+                img = stage(img)
+                continue
+            parts = self.split(img.shape[0])
+            param = None
+            if stage.stats is not None:
+                total = sum(self.pool.map(lambda r: stage.stats(img, *r), parts))
+                param = stage.finalize(total, img)
+            # 第一块在当前线程算出，用来确定输出的尺寸和类型
+            first = stage.band(img, *parts[0], param)
+            dst = np.empty((img.shape[0],) + first.shape[1:], dtype=first.dtype)
+            dst[: parts[0][1]] = first
+
+            def work(r):
+                dst[r[0] : r[1]] = stage.band(img, *r, param)
+
+            list(self.pool.map(work, parts[1:]))
+            img = dst
+        return img
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    path = "./img/raw_day_0.txt"
+    src = create_img(path, (1088, 1936), 1)
+
+    run = BandExecutor([RAW2RGB, lambda img: img[3:1083, 7:1927], RETINEX, HE, AWB])
+    start = time()
+    dst = run(src)
+    print(f"Running time = {time()-start}s")
+    run.close()
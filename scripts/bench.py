@@ -0,0 +1,254 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        bench.py
+# Descriptions:     各算法模块的性能测试
+# -----------------------------------------README-----------------------------------------
+# 在540p、1080p、4K三种分辨率下，分别用合成图像和img/里的图像测试各算法的耗时：
+#   python scripts/bench.py --out bench.json
+#   python scripts/bench.py --compare bench.json   # 与保存的基线对比，变慢超过阈值时返回1
+#
+# 每个测试在单独的子进程里运行：先预热，再重复计时，报告中位数、p90、p99延迟和每秒处理的百万像素数；
+# 最后单独运行一次，统计峰值分配内存（tracemalloc）和子进程的峰值RSS（没有resource模块时用psutil，都没有时为null）。
+# 结果JSON中延迟单位为ms，内存单位为MB。
+#
+# 除单个模块外，还测试raw2rgb -> Retinex -> HE -> AWB级联的三种执行方式（逐级整帧、行块融合、多线程分块）。
+# 逐像素循环实现的参考模型（CLAHE.py）默认只测540p，且只运行一次。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import sys
+import json
+import argparse
+import functools
+import platform
+import importlib
+import tracemalloc
+import multiprocessing
+import cv2
+import numpy as np
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # resource只在POSIX系统上有
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./CLAHE/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Scaling/py/")
+sys.path.append("./Retinex/py/")
+sys.path.append("./Sobel/py/")
+sys.path.append("./scripts/")
+
+from img_sim import mosaic
+
+SIZES = {"540p": (540, 960), "1080p": (1080, 1920), "4K": (2160, 3840)}
+IMAGES = {"day": "./img/day-0.png", "night": "./img/night-0.png"}
+
+
+def half(img: np.ndarray) -> np.ndarray:
+    return cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_AREA)
+
+
+def crop16(img: np.ndarray) -> np.ndarray:
+    """CLAHE分8x8块，块的边长需要是偶数，因此h和w裁剪为16的整数倍"""
+    return img[: img.shape[0] // 16 * 16, : img.shape[1] // 16 * 16]
+
+
+def module_func(module: str, func: str):
+    """单个模块的函数，调用时只传入图像"""
+    return lambda size: getattr(importlib.import_module(module), func)
+
+
+def cascade(mode: str):
+    """raw2rgb -> Retinex -> HE -> AWB级联：serial逐级整帧、pipeline联合直方图融合、bands多线程分块"""
+
+    def build(size):
+        import bands
+        import pipeline
+        from raw2rgb import raw2rgb
+        from Retinex_FPGA import Retinex
+        from HE_FPGA import HE
+        from AWB_FPGA import AWB
+
+        if mode == "serial":
+            funcs = [raw2rgb, Retinex, HE, AWB]
+            return lambda img: functools.reduce(lambda x, f: f(x), funcs, img)
+        if mode == "pipeline":
+            fused = pipeline.Pipeline([pipeline.RETINEX, pipeline.HE, pipeline.AWB])
+            return lambda img: fused(raw2rgb(img))
+        return bands.BandExecutor([bands.RAW2RGB, bands.RETINEX, bands.HE, bands.AWB])
+
+    return build
+
+
+# 名称: (构造函数, 输入预处理, 默认分辨率)，构造函数由输出分辨率得到被测函数
+STAGES = {
+    "raw2rgb": (module_func("raw2rgb", "raw2rgb"), mosaic, None),
+    "Retinex": (module_func("Retinex", "Retinex"), None, None),
+    "Retinex_FPGA": (module_func("Retinex_FPGA", "Retinex"), None, None),
+    "HE_FPGA": (module_func("HE_FPGA", "HE"), None, None),
+    "CLAHE": (module_func("CLAHE", "CLAHE"), lambda img: crop16(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)), ("540p",)),
+    "CLAHE_FPGA": (module_func("CLAHE_FPGA", "CLAHE"), crop16, None),
+    "AWB": (module_func("AWB_FPGA", "AWB"), None, None),
+    "bi_linear": (lambda size: functools.partial(importlib.import_module("BiLinear").bi_linear, target_size=size), half, None),
+    "bi_linear_FPGA": (
+        lambda size: functools.partial(importlib.import_module("BiLinear_FPGA").bi_linear, scale=2, target_size=size),
+        half,
+        None,
+    ),
+    "Sobel": (module_func("Sobel", "Sobel"), None, None),
+    "Sobel_FPGA": (module_func("Sobel_FPGA", "Sobel"), None, None),
+    "cascade": (cascade("serial"), mosaic, None),
+    "cascade_pipeline": (cascade("pipeline"), mosaic, None),
+    "cascade_bands": (cascade("bands"), mosaic, None),
+}
+
+
+def make_input(name: str, size) -> np.ndarray:
+    """生成指定分辨率的BGR图像：synthetic为渐变加噪声，其余为img/里的图像缩放"""
+    height, width = size
+    if name == "synthetic":
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[0:height, 0:width]
+        base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+        img = base + rng.integers(-16, 17, base.shape)
+        return img.clip(0, 255).astype(np.uint8)
+    img = cv2.imread(IMAGES[name])[4:1084, 8:1928]
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def peak_rss_mb():
+    """本进程的峰值RSS（MB），没有resource时用psutil，都没有时返回None"""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2**20 if sys.platform == "darwin" else rss / 1024  # macOS上单位为字节，Linux上为KB
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20  # Windows上为峰值工作集，其他系统只有当前RSS
+    return None
+
+
+def run_case(stage: str, size_name: str, input_name: str, repeats: int, warmup: int, alloc: bool = True) -> dict:
+    """在子进程中执行一个测试"""
+    build, prep, _ = STAGES[stage]
+    size = SIZES[size_name]
+    func = build(size)
+    src = make_input(input_name, size)
+    if prep is not None:
+        src = prep(src)
+
+    for _ in range(warmup):
+        func(src)
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        func(src)
+        times.append(perf_counter() - start)
+
+    peak_alloc = None
+    if alloc:  # tracemalloc会让逐像素循环慢数十倍，慢速模型不统计
+        tracemalloc.start()
+        func(src)
+        peak_alloc = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    median = float(np.median(times))
+    return {
+        "stage": stage,
+        "size": size_name,
+        "input": input_name,
+        "repeats": repeats,
+        "median_ms": median,
+        "p90_ms": float(np.percentile(times, 90)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "min_ms": float(times.min()),
+        "mpix_per_s": size[0] * size[1] / 1e6 / (median / 1000),
+        "peak_alloc_mb": peak_alloc,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _run_case(args):
+    return run_case(*args)
+
+
+def compare(results, baseline, threshold: float):
+    """按(模块, 分辨率, 输入)对比中位数耗时，返回变慢超过阈值的测试"""
+    base = {(r["stage"], r["size"], r["input"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = base.get((r["stage"], r["size"], r["input"]))
+        if old is None:
+            continue
+        ratio = r["median_ms"] / old["median_ms"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{r['stage']:>15} {r['size']:>6} {r['input']:>9} {old['median_ms']:10.2f} -> {r['median_ms']:10.2f} ms  x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ISP算法性能测试")
+    parser.add_argument("--stages", default=",".join(STAGES), help="逗号分隔的模块名")
+    parser.add_argument("--sizes", default=None, help="逗号分隔的分辨率，默认使用各模块的默认分辨率")
+    parser.add_argument("--inputs", default="synthetic,day,night", help="逗号分隔的输入图像")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--out", default=None, help="结果保存为JSON")
+    parser.add_argument("--compare", default=None, help="与保存的JSON基线对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="中位数变慢超过该比例视为退化")
+    args = parser.parse_args()
+
+    cases = []
+    for stage in args.stages.split(","):
+        sizes = args.sizes.split(",") if args.sizes else STAGES[stage][2] or tuple(SIZES)
+        slow = STAGES[stage][2] is not None
+        for size in sizes:
+            for input_name in args.inputs.split(","):
+                if slow:
+                    cases.append((stage, size, input_name, 1, 0, False))
+                else:
+                    cases.append((stage, size, input_name, args.repeats, args.warmup))
+
+    # 每个测试用新的子进程，峰值RSS互不影响
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        for r in pool.imap(_run_case, cases):
+            print(
+                f"{r['stage']:>15} {r['size']:>6} {r['input']:>9}  median {r['median_ms']:10.2f} ms"
+                f"  p90 {r['p90_ms']:10.2f} ms  {r['mpix_per_s']:8.2f} MP/s"
+                f"  alloc {r['peak_alloc_mb'] or 0:8.1f} MB  rss {r['peak_rss_mb'] or 0:8.1f} MB"
+            )
+            results.append(r)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
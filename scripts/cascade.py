@@ -11,7 +11,6 @@
 
 
 import cv2
-import numpy as np
 from time import time
 import sys
 sys.path.append("./Raw2rgb/py/")
@@ -22,35 +21,28 @@ sys.path.append("./Scaling/py/")
 sys.path.append("./Retinex/py/")
 sys.path.append("./Sobel/py/")
 
-from raw2rgb import raw2rgb
-from CLAHE_FPGA import CLAHE
-from HE_FPGA import HE
-from AWB_FPGA import AWB
-from BiLinear_FPGA import bi_linear
-from Retinex_FPGA import Retinex
-from Sobel import Sobel
-
-from img_sim import create_img, gen_txt
+from img_sim import create_img
+import pipeline
+import roi
 
 
 if __name__ == "__main__":
     path = "./img/raw_day_0.txt"
     # path = "./raw_night_0.txt"
-    src = raw2rgb(create_img(path, (1088, 1936), 1))[3:1083, 7:1927]
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[184:903, 328:1605]  # 1.5
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[255:831, 455:1479]  # 1.875
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[272:814, 486:1448]  # 2
+    # 只对裁剪区域（加上一圈邻域）做插值
+    raw = roi.Raw2rgb(roi.Source(create_img(path, (1088, 1936), 1)))
+    src = raw[3:1083, 7:1927].compute()
+    # src = raw[184:903, 328:1605].compute()  # 1.5
+    # src = raw[255:831, 455:1479].compute()  # 1.875
+    # src = raw[272:814, 486:1448].compute()  # 2
 
     start = time()
     cv2.imshow("src", cv2.resize(src, (960, 540)))
     dst = src.copy()
-    # dst = bi_linear(src, 1.5)
+    # dst = roi.Scale(roi.Source(src), 1.5).compute()
     # cv2.imshow("scaling", cv2.resize(dst, (960, 540)))
-    dst = Retinex(dst)
-    cv2.imshow("Retinex", cv2.resize(dst, (960, 540)))
-    dst = HE(dst)
-    cv2.imshow("HE", cv2.resize(dst, (960, 540)))
-    dst = AWB(dst)
+    # Retinex -> HE -> AWB融合执行：一遍统计联合直方图，一遍查合成表，结果与逐级调用一致
+    dst = pipeline.Pipeline([pipeline.RETINEX, pipeline.HE, pipeline.AWB])(dst)
     cv2.imshow("AWB", cv2.resize(dst, (960, 540)))
     print(f"Running time = {time()-start}s")
 
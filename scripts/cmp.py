@@ -4,15 +4,23 @@
 # File Name:        cmp.py
 # Descriptions:     对比软件实现和硬件仿真的结果
 # -----------------------------------------README-----------------------------------------
+# 增量读取仿真输出的txt（tb_isp.v每个有效像素`$fwrite`一行），每读到完整的若干行图像，
+# 立即与软件模型的对应行比较，不需要等仿真结束：
+#   python scripts/cmp.py --rtl out.txt --stage HE --follow --stop
 #
+# txt里可以连续存放多帧，按帧分别比较；软件模型只有一帧时，每帧都与它比较。
+# 统计每个分块（默认120x120）的最大误差、平均误差和不一致像素数，记录第一个不一致的像素，
+# 输出紧凑的文本报告。--stop时在第一个不一致的行停止。
+# 误差按有符号整数计算，不会因uint8回绕。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
+import os
+import argparse
 import numpy as np
-from time import time
+from time import time, sleep
 import sys
 sys.path.append("./Raw2rgb/py/")
 sys.path.append("./CLAHE/py/")
@@ -22,41 +30,162 @@ sys.path.append("./Scaling/py/")
 sys.path.append("./Retinex/py/")
 sys.path.append("./Sobel/py/")
 
-from raw2rgb import raw2rgb
-from CLAHE_FPGA import CLAHE
-from HE_FPGA import HE
-from AWB_FPGA import AWB
-from BiLinear_FPGA import bi_linear
-from Retinex_FPGA import Retinex
-from Sobel import Sobel
+from img_sim import create_img, decode_hex
 
-from img_sim import create_img, gen_txt
+
+def read_rows(path: str, width: int, channel: int = 3, follow: bool = False, poll: float = 0.2, idle: float = 10.0):
+    """增量读取txt，每次产出当前已写完的若干整行图像。
+    follow为True时像`tail -f`一样等待仿真继续写入，idle秒内没有新数据则结束"""
+    while follow and not os.path.exists(path):
+        sleep(poll)
+    rest = b""  # 未写完的一行
+    line = 1  # 下一个完整行的行号，出错时报告
+    pixels = np.zeros(0, dtype=np.uint32)  # 未凑满一行图像的像素
+    last = time()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                if not follow or time() - last > idle:
+                    break
+                sleep(poll)
+                continue
+            last = time()
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end == 0:
+                continue
+            pixels = np.concatenate([pixels, decode_hex(data[:end], line)])
+            line += data.count(b"\n", 0, end)
+            rows = pixels.size // width
+            if rows == 0:
+                continue
+            values = pixels[: rows * width].reshape(rows, width)
+            pixels = pixels[rows * width :]
+            if channel == 1:
+                yield values.astype(np.uint8)
+            else:
+                yield np.stack([values & 0xFF, (values >> 8) & 0xFF, (values >> 16) & 0xFF], axis=-1).astype(np.uint8)
+
+
+class FrameDiff:
+    """逐行累计一帧的分块误差统计"""
+
+    def __init__(self, ref: np.ndarray, tile: int = 120):
+        self.ref = ref
+        self.tile = tile
+        height, width = ref.shape[:2]
+        shape = (-(-height // tile), -(-width // tile))
+        self.max = np.zeros(shape, dtype=np.int32)
+        self.sum = np.zeros(shape, dtype=np.int64)
+        self.bad = np.zeros(shape, dtype=np.int64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.row = 0  # 已比较的行数
+        self.first = None  # 第一个不一致的像素：(y, x, 模型值, 仿真值)
+        self.cols = np.arange(0, width, tile)
+
+    def update(self, rows: np.ndarray) -> bool:
+        """比较接下来的若干行，返回是否出现了不一致"""
+        r0, r1 = self.row, self.row + rows.shape[0]
+        ref = self.ref[r0:r1]
+        err = np.abs(rows.astype(np.int16) - ref.astype(np.int16))
+        if err.ndim == 3:
+            err = err.max(axis=-1)
+        bad = err != 0
+        if self.first is None and bad.any():
+            y, x = np.unravel_index(np.argmax(bad), bad.shape)
+            self.first = (r0 + int(y), int(x), ref[y, x].tolist(), rows[y, x].tolist())
+        # 按分块行分组，行块可能跨越分块边界
+        tiles = np.arange(r0, r1) // self.tile
+        for t in np.unique(tiles):
+            sel = tiles == t
+            self.max[t] = np.maximum(self.max[t], np.maximum.reduceat(err[sel].max(axis=0), self.cols))
+            self.sum[t] += np.add.reduceat(err[sel].sum(axis=0, dtype=np.int64), self.cols)
+            self.bad[t] += np.add.reduceat(bad[sel].sum(axis=0), self.cols)
+            self.count[t] += np.add.reduceat(np.full(err.shape[1], sel.sum()), self.cols)
+        self.row = r1
+        return bool(bad.any())
+
+    @property
+    def done(self) -> bool:
+        return self.row >= self.ref.shape[0]
+
+    def report(self, frame: int) -> str:
+        lines = [
+            f"frame {frame}: rows {self.row}/{self.ref.shape[0]}  max {self.max.max()}"
+            f"  mean {self.sum.sum() / max(self.count.sum(), 1):.4f}  mismatched {self.bad.sum()}"
+        ]
+        if self.first is not None:
+            y, x, ref, rtl = self.first
+            lines.append(f"  first mismatch at (y={y}, x={x}): model {ref}, rtl {rtl}")
+            lines.append(f"  tile max error ({self.tile}x{self.tile}, '.' = exact):")
+            for t in range(self.max.shape[0]):
+                if t * self.tile >= self.row:
+                    break
+                lines.append("    " + " ".join(f"{v:3d}" if v else "  ." for v in self.max[t]))
+        return "\n".join(lines)
+
+
+def compare(path: str, refs, channel: int = 3, tile: int = 120, stop: bool = False, follow: bool = False):
+    """将仿真输出与软件模型逐帧比较，返回各帧的FrameDiff。
+    refs为一帧(h, w[, 3])或多帧(n, h, w[, 3])的模型结果"""
+    refs = np.asarray(refs)
+    if refs.ndim == (3 if channel == 3 else 2):  # 单帧：每帧都与它比较
+        refs = refs[None]
+    height, width = refs.shape[1:3]
+    frames = []
+    diff = None
+    for rows in read_rows(path, width, channel, follow):
+        while rows.shape[0]:
+            if diff is None or diff.done:
+                diff = FrameDiff(refs[min(len(frames), len(refs) - 1)], tile)
+                frames.append(diff)
+            n = min(rows.shape[0], height - diff.row)
+            bad = diff.update(rows[:n])
+            rows = rows[n:]
+            if bad and stop:
+                return frames
+    return frames
 
 
 if __name__ == "__main__":
-    path = "./img/raw_day_0.txt"
-    # path = "./img/raw_night_0.txt"
-    src = raw2rgb(create_img(path, (1088, 1936), 1))[3:1083, 7:1927]
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[184:903, 328:1605]  # 1.5
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[255:831, 455:1479]  # 1.875
-    # src = raw2rgb(create_img(path, (1088, 1936), 1))[272:814, 486:1448]  # 2
+    from roi import Raw2rgb, Source
+    from CLAHE_FPGA import CLAHE
+    from HE_FPGA import HE
+    from AWB_FPGA import AWB
+    from BiLinear_FPGA import bi_linear
+    from Retinex_FPGA import Retinex
+    from Sobel_FPGA import Sobel
 
+    stages = {
+        "none": lambda img: img,
+        "CLAHE": CLAHE,
+        "HE": HE,
+        "AWB": AWB,
+        "Retinex": Retinex,
+        "Sobel": lambda img: np.repeat(Sobel(img)[..., None], 3, axis=-1),  # RTL三个通道输出相同的值
+        "scale": lambda img: bi_linear(img, 1.5),
+    }
+    parser = argparse.ArgumentParser(description="对比软件模型和RTL仿真输出")
+    parser.add_argument("--raw", default="./img/raw_day_0.txt", help="RAW输入（./img/raw_night_0.txt等）")
+    parser.add_argument("--rtl", default="E:/FPGA/Xilinx/projects/ISP/ISP.srcs/sim_1/new/output/out.txt")
+    parser.add_argument("--stage", default="HE", choices=stages)
+    parser.add_argument("--crop", default="3,1083,7,1927", help="raw2rgb后的裁剪范围：上,下,左,右")
+    parser.add_argument("--tile", type=int, default=120)
+    parser.add_argument("--stop", action="store_true", help="出现第一个不一致时停止")
+    parser.add_argument("--follow", action="store_true", help="仿真仍在运行，持续读取新写入的数据")
+    args = parser.parse_args()
+    # 缩放使用的裁剪：1.5 -> 184,903,328,1605  1.875 -> 255,831,455,1479  2 -> 272,814,486,1448
+
+    top, bottom, left, right = (int(v) for v in args.crop.split(","))
+    src = Raw2rgb(Source(create_img(args.raw, (1088, 1936), 1)))[top:bottom, left:right].compute()  # 只插值裁剪区域
     start = time()
-    dst = HE(src)
-    # dst = bi_linear(src, 1.5)
-    # dst = cv2.resize(src, (1920, 1080))
+    dst = stages[args.stage](src)
     print(f"Running time = {time()-start}s")
 
-    fpga = create_img("E:/FPGA/jichuangsai/MTH_SoC/Hardware/sim/output/out.txt", (1080, 1920), 3)
-    err = (dst.astype(np.int32) - fpga.astype(np.int32)).__abs__().astype(np.uint8)
-    print(err.max(), err.mean())
-    cv2.imshow("src", cv2.resize(src, (960, 540)))
-    cv2.imshow("dst", cv2.resize(dst, (960, 540)))
-    cv2.imshow("fpga", cv2.resize(fpga, (960, 540)))
-    # err[err!=0] = 255
-    cv2.imshow("err", cv2.resize(err, (960, 540)))
-    while True:
-        k = cv2.waitKey(1) & 0xFF
-        if k == ord("q"):  # 按下q键，程序退出
-            break
-    cv2.destroyAllWindows()  # 释放并销毁窗口
+    start = time()
+    frames = compare(args.rtl, dst, 3 if dst.ndim == 3 else 1, args.tile, args.stop, args.follow)
+    for k, diff in enumerate(frames):
+        print(diff.report(k))
+    print(f"Compare time = {time()-start}s")
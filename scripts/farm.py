@@ -0,0 +1,124 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        farm.py
+# Descriptions:     多进程并行处理帧序列
+# -----------------------------------------README-----------------------------------------
+# 把帧序列分发到进程池，每个进程对一帧执行完整的级联（任意一组算法函数）。
+#
+# 帧数据和结果都放在共享内存的槽位里，进程间只传递槽位号，不对图像做pickle。
+# 槽位循环使用，内存占用与序列长度无关；结果严格按输入顺序产出。
+#
+# 第一帧在主进程中处理，用来确定输出的尺寸和类型，之后所有帧的输入、输出尺寸必须一致。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import sys
+import pickle
+import numpy as np
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from time import time
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Retinex/py/")
+
+from img_sim import create_img
+
+_worker = {}
+
+
+class Crop:
+    """裁剪，可以放进级联里（lambda不能跨进程传递）"""
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        return img[self.rows[0] : self.rows[1], self.cols[0] : self.cols[1]]
+
+
+def run_chain(img: np.ndarray, stages) -> np.ndarray:
+    for stage in stages:
+        img = stage(img)
+    return img
+
+
+def _init(path, shm_in, in_spec, shm_out, out_spec, stages):
+    sys.path[:] = path  # 先恢复搜索路径，再反序列化各级函数
+    _worker["in"] = SharedMemory(shm_in)
+    _worker["out"] = SharedMemory(shm_out)
+    _worker["in_buf"] = np.ndarray(in_spec[0], dtype=in_spec[1], buffer=_worker["in"].buf)
+    _worker["out_buf"] = np.ndarray(out_spec[0], dtype=out_spec[1], buffer=_worker["out"].buf)
+    _worker["stages"] = pickle.loads(stages)
+
+
+def _work(slot: int):
+    _worker["out_buf"][slot] = run_chain(_worker["in_buf"][slot], _worker["stages"])
+
+
+def farm(frames, stages, workers: int = None, slots: int = None):
+    """按输入顺序产出每帧经过stages后的结果"""
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+    dst = run_chain(first, stages)
+    yield dst
+
+    workers = workers or os.cpu_count()
+    slots = slots or 2 * workers
+    in_spec = ((slots,) + first.shape, first.dtype)
+    out_spec = ((slots,) + dst.shape, dst.dtype)
+    shm_in = SharedMemory(create=True, size=slots * first.nbytes)
+    shm_out = SharedMemory(create=True, size=slots * dst.nbytes)
+    try:
+        in_buf = np.ndarray(in_spec[0], dtype=in_spec[1], buffer=shm_in.buf)
+        out_buf = np.ndarray(out_spec[0], dtype=out_spec[1], buffer=shm_out.buf)
+        initargs = (list(sys.path), shm_in.name, in_spec, shm_out.name, out_spec, pickle.dumps(stages))
+        with Pool(workers, initializer=_init, initargs=initargs) as pool:
+            pending = deque()
+            free = deque(range(slots))
+
+            def collect():
+                slot, result = pending.popleft()
+                result.get()  # 子进程出错时在这里抛出
+                free.append(slot)
+                return out_buf[slot].copy()
+
+            for frame in frames:
+                if not free:
+                    yield collect()
+                slot = free.popleft()
+                in_buf[slot] = frame
+                pending.append((slot, pool.apply_async(_work, (slot,))))
+            while pending:
+                yield collect()
+    finally:
+        in_buf = out_buf = None  # 先释放对共享内存的引用
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+
+if __name__ == "__main__":
+    from raw2rgb import raw2rgb
+    from Retinex_FPGA import Retinex
+    from HE_FPGA import HE
+    from AWB_FPGA import AWB
+
+    paths = ["./img/raw_day_0.txt", "./img/raw_night_0.txt"]
+    stages = [raw2rgb, Crop((3, 1083), (7, 1927)), Retinex, HE, AWB]
+
+    start = time()
+    frames = (create_img(path, (1088, 1936), 1) for path in paths)
+    for k, dst in enumerate(farm(frames, stages)):
+        print(k, dst.shape)
+    print(f"Running time = {time()-start}s")
@@ -0,0 +1,141 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        frames.py
+# Descriptions:     内存映射的多帧图像文件
+# -----------------------------------------README-----------------------------------------
+# 把RAW或RGB帧序列存为一个文件：
+#   0    ：8字节标识"ISPFRM01"，4字节小端头长度，JSON格式的头信息
+#          {"shape": [h, w], "channel": 1或3, "depth": 位宽, "bayer": "GBRG", "crop": [上, 下, 左, 右]}
+#   4096 ：连续存放的各帧，位宽不超过8bits时为uint8，否则为uint16
+# 帧数由文件大小得到，追加帧时不需要改写头信息。
+#
+# 读取时整个文件内存映射，取第N帧或其中一块区域只读取用到的部分，不需要把序列载入内存。
+# `crop`记录有效区域（如RAW插值后的[3:1083, 7:1927]），用`FrameStore.cropped`取出。
+#
+# `txt2store`、`store2txt`与img_sim的txt格式互相转换，一个txt里可以有多帧。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import json
+import struct
+import numpy as np
+from time import time
+
+from img_sim import decode_hex, encode_hex
+
+MAGIC = b"ISPFRM01"
+DATA_OFFSET = 4096
+
+
+def frame_dtype(depth: int):
+    return np.uint8 if depth <= 8 else np.uint16
+
+
+class FrameStore:
+    """只读打开一个多帧文件，store[n]为第n帧（内存映射，不复制）"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(8) != MAGIC:
+                raise ValueError(f"{path} is not a frame store")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+        height, width = self.header["shape"]
+        channel = self.header["channel"]
+        self.frame_shape = (height, width) if channel == 1 else (height, width, channel)
+        self.dtype = frame_dtype(self.header["depth"])
+        frame_bytes = int(np.prod(self.frame_shape)) * np.dtype(self.dtype).itemsize
+        count = (os.path.getsize(path) - DATA_OFFSET) // frame_bytes
+        self.frames = np.memmap(path, dtype=self.dtype, mode="r", offset=DATA_OFFSET, shape=(count,) + self.frame_shape)
+
+    def __len__(self) -> int:
+        return self.frames.shape[0]
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def roi(self, n: int, rows, cols) -> np.ndarray:
+        """第n帧中rows=(上, 下)、cols=(左, 右)的区域"""
+        return self.frames[n, rows[0] : rows[1], cols[0] : cols[1]]
+
+    def cropped(self, n: int) -> np.ndarray:
+        """第n帧按头信息中的crop裁剪"""
+        crop = self.header.get("crop")
+        if crop is None:
+            return self.frames[n]
+        return self.roi(n, crop[:2], crop[2:])
+
+
+class FrameWriter:
+    """新建多帧文件并逐帧追加"""
+
+    def __init__(self, path: str, shape, channel: int = 1, depth: int = 8, bayer: str = None, crop=None):
+        header = {"shape": list(shape[:2]), "channel": channel, "depth": depth, "bayer": bayer, "crop": crop}
+        data = json.dumps(header).encode()
+        if 12 + len(data) > DATA_OFFSET:
+            raise ValueError("header too long")
+        self.dtype = frame_dtype(depth)
+        self.frame_shape = tuple(shape[:2]) if channel == 1 else tuple(shape[:2]) + (channel,)
+        self.f = open(path, "wb")
+        self.f.write((MAGIC + struct.pack("<I", len(data)) + data).ljust(DATA_OFFSET, b"\0"))
+
+    def append(self, frame: np.ndarray):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"frame shape {frame.shape} does not match {self.frame_shape}")
+        self.f.write(np.ascontiguousarray(frame, dtype=self.dtype).tobytes())
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def txt2store(txt_paths, store_path: str, shape, channel: int = 1, depth: int = 8, bayer: str = None, crop=None):
+    """把一个或多个txt（每个可以有多帧）转换为多帧文件，返回帧数"""
+    if isinstance(txt_paths, str):
+        txt_paths = [txt_paths]
+    height, width = shape[:2]
+    count = 0
+    with FrameWriter(store_path, shape, channel, depth, bayer, crop) as writer:
+        for path in txt_paths:
+            with open(path, "rb") as f:
+                values = decode_hex(f.read())
+            values = values[: values.size // (height * width) * (height * width)].reshape(-1, height, width)
+            if channel == 3:
+                values = np.stack([values & 0xFF, (values >> 8) & 0xFF, (values >> 16) & 0xFF], axis=-1)
+            for frame in values:
+                writer.append(frame)
+                count += 1
+    return count
+
+
+def store2txt(store: FrameStore, txt_path: str, frames=None):
+    """把多帧文件中的若干帧（默认全部）按顺序写入一个txt，格式与img_sim.gen_txt一致"""
+    frames = range(len(store)) if frames is None else frames
+    digits = 2 if store.header["depth"] <= 8 else (store.header["depth"] + 3) // 4
+    with open(txt_path, "wb") as f:
+        for n in frames:
+            frame = store[n]
+            if store.header["channel"] == 1:
+                f.write(encode_hex(frame, digits))
+            else:
+                b, g, r = (frame[..., k].astype(np.uint32) for k in range(3))
+                f.write(encode_hex((r << 16) | (g << 8) | b, 6))
+
+
+if __name__ == "__main__":
+    paths = ["./img/raw_day_0.txt", "./img/raw_night_0.txt"]
+
+    start = time()
+    count = txt2store(paths, "./img/raw.frames", (1088, 1936), 1, bayer="GBRG", crop=[3, 1083, 7, 1927])
+    print(f"Running time = {time()-start}s")
+    store = FrameStore("./img/raw.frames")
+    print(count, store.header, store[1].shape)
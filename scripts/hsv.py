@@ -0,0 +1,51 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        hsv.py
+# Descriptions:     HSV空间V通道调整后还原回RGB
+# -----------------------------------------README-----------------------------------------
+# 只改变V通道时，还原回RGB等价于每个通道乘以new_V / V：
+#   dst = c * new_V // max(V, 1)
+# 除法改为乘以倒数表再右移：RECIP[V] = ceil(2^24 / V)。c不超过V、new_V不超过255，
+# 对所有可能的输入，(c * new_V * RECIP[V]) >> 24与整数除法的结果完全相同，乘积不超过32bits。
+#
+# 调用方传入已经算好的V通道（三通道最大值），结果写入`out`；
+# 按行块处理，临时数组只有行块大小，不产生整帧的中间结果。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import numpy as np
+
+RECIP_SHIFT = 24
+RECIP = np.zeros(256, dtype=np.uint32)  # V为0时c也为0，表项取0即可
+RECIP[1:] = -(-(1 << RECIP_SHIFT) // np.arange(1, 256))
+
+
+def rescale_v(bgr: np.ndarray, new_V: np.ndarray, V: np.ndarray = None, out: np.ndarray = None, band: int = 64):
+    """把bgr的V通道从V调整为new_V，V为None时由bgr计算。支持N×H×W×3的多帧数据"""
+    if V is None:
+        V = np.maximum(np.maximum(bgr[..., 0], bgr[..., 1]), bgr[..., 2])
+    if out is None:
+        out = np.empty(bgr.shape, dtype=np.uint8)
+    if bgr.ndim > 3:
+        for k in range(bgr.shape[0]):
+            rescale_v(bgr[k], new_V[k], V[k], out[k], band)
+        return out
+
+    height, width = bgr.shape[:2]
+    band = max(1, min(band, height))  # 流式处理时可能送来0行的行块
+    scale = np.empty((band, width), dtype=np.uint32)  # new_V * RECIP[V]
+    tmp = np.empty((band, width), dtype=np.uint32)
+    for r0 in range(0, height, band):
+        r1 = min(r0 + band, height)
+        s = scale[: r1 - r0]
+        t = tmp[: r1 - r0]
+        np.take(RECIP, V[r0:r1], out=s, mode="clip")
+        s *= new_V[r0:r1]
+        for ch in range(3):
+            np.multiply(bgr[r0:r1, :, ch], s, out=t)
+            t >>= RECIP_SHIFT
+            out[r0:r1, :, ch] = t
+    return out
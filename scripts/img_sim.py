@@ -4,51 +4,130 @@
 # File Name:        img_sim.py
 # Descriptions:     用于编解码RTL仿真用的图像的txt数据
 # -----------------------------------------README-----------------------------------------
-# txt里的每一行代表一个像素点数据。
+# txt里的每一行代表一个像素点数据，格式与`$readmemh`一致：
+#   gray：8bits灰度（由BGR图像转换）
+#   raw ：8bits单通道数据（如GBRG格式的RAW图像），直接输出；`mosaic`把BGR图像按GBRG格式采样为RAW数据
+#   rgb ：24bits，按RRGGBB排列
+#
+# 解码时会在txt旁边生成一个`.npy`缓存，其修改时间与txt保持一致；
+# txt未改动时直接内存映射读取缓存，跳过解析。
 #
 # ----------------------------------------------------------------------------------------
 # ****************************************************************************************#
 
 
-import cv2
+import os
 import numpy as np
 
+HEX_CHAR = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+HEX_VALUE = np.full(256, 0xFF, dtype=np.uint8)  # ASCII码 -> 4bits数值，非十六进制字符为0xFF
+HEX_VALUE[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+HEX_VALUE[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+HEX_VALUE[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+SPACE = np.frombuffer(b" \t\r\n", dtype=np.uint8)
+
+
+def encode_hex(values: np.ndarray, digits: int) -> bytes:
+    """将一维整数数组编码为每行一个、定长的十六进制文本"""
+    values = np.asarray(values, dtype=np.uint32).reshape(-1)
+    lines = np.empty((values.size, digits + 1), dtype=np.uint8)
+    for k in range(digits):
+        lines[:, k] = HEX_CHAR[(values >> (4 * (digits - 1 - k))) & 0xF]
+    lines[:, digits] = ord("\n")
+    return lines.tobytes()
+
+
+def decode_hex(data: bytes, first_line: int = 1) -> np.ndarray:
+    """将每行一个十六进制数的文本解码为一维uint32数组，忽略空行；
+    含有非十六进制字符的行抛出ValueError，first_line为data第一行在文件中的行号"""
+    if(data and not data.endswith(b"\n")):
+        data += b"\n"
+    buf = np.frombuffer(data, dtype=np.uint8)
+    nibble = HEX_VALUE[buf]
+    is_hex = nibble != 0xFF
+    # 定长格式（gen_txt的输出）：直接reshape
+    digits = int(np.argmin(is_hex)) if not is_hex.all() else buf.size
+    stride = digits + 1
+    if 0 < digits <= 8 and buf.size % stride == 0:
+        lines = nibble.reshape(-1, stride)
+        if (lines[:, :digits] != 0xFF).all() and (buf[digits::stride] == ord("\n")).all():
+            values = np.zeros(lines.shape[0], dtype=np.uint32)
+            for k in range(digits):
+                values = (values << 4) | lines[:, k]
+            return values
+    # 不定长格式：按行号和行内位置累加。空白字符忽略，其他字符（如RTL输出的x、z）报错，不能丢掉整行
+    bad = ~is_hex & ~np.isin(buf, SPACE)
+    if bad.any():
+        pos = int(np.argmax(bad))
+        start = data.rfind(b"\n", 0, pos) + 1
+        text = data[start : data.find(b"\n", pos)].decode(errors="replace").strip()
+        number = data.count(b"\n", 0, pos) + first_line
+        raise ValueError(f"line {number}: not a hex value: {text!r}")
+    line = np.cumsum(buf == ord("\n"))[is_hex]
+    nibble = nibble[is_hex].astype(np.uint32)
+    _, start, count = np.unique(line, return_index=True, return_counts=True)
+    shift = (np.repeat(start + count, count) - 1 - np.arange(line.size)).astype(np.uint32)
+    return np.bitwise_or.reduceat(nibble << (4 * shift), start)
+
 
 def gen_txt(img: np.ndarray, out_path: str, gray: bool = False):
-    """将图像文件转换为txt数据，用于仿真"""
-    height, width = img.shape[0], img.shape[1]
+    """将图像文件转换为txt数据，用于仿真。单通道图像按raw格式输出"""
     if(gray):
+        import cv2
+
         img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    with open(out_path, "w") as f:
-        for i in range(height):
-            for j in range(width):
-                if(gray):
-                    f.write(hex(img[i][j])[2:] + "\n")
-                else:
-                    txt = "{:0>2}{:0>2}{:0>2}\n".format(hex(img[i][j][2])[2:], hex(img[i][j][1])[2:], hex(img[i][j][0])[2:])
-                    f.write(txt)
+    if(img.ndim == 2):
+        data = encode_hex(img, 2)
+    else:
+        b, g, r = (img[:, :, k].astype(np.uint32) for k in range(3))
+        data = encode_hex((r << 16) | (g << 8) | b, 6)
+    with open(out_path, "wb") as f:
+        f.write(data)
 
 
-def create_img(txt_path: str, shape=(1080, 1920), channel: int=3) -> np.ndarray:
+def mosaic(bgr: np.ndarray) -> np.ndarray:
+    """BGR图像按GBRG格式采样为RAW数据"""
+    raw = np.empty(bgr.shape[:2], dtype=np.uint8)
+    raw[0::2, 0::2] = bgr[0::2, 0::2, 1]
+    raw[0::2, 1::2] = bgr[0::2, 1::2, 0]
+    raw[1::2, 0::2] = bgr[1::2, 0::2, 2]
+    raw[1::2, 1::2] = bgr[1::2, 1::2, 1]
+    return raw
+
+
+def create_img(txt_path: str, shape=(1080, 1920), channel: int=3, cache: bool=True) -> np.ndarray:
     """将仿真输出的txt数据转换为图像显示"""
+    height, width = shape[0], shape[1]
+    img_shape = (height, width) if channel == 1 else (height, width, 3)
+    cache_path = txt_path + ".npy"
+    stat = os.stat(txt_path)
+    if(cache and os.path.exists(cache_path) and os.stat(cache_path).st_mtime_ns == stat.st_mtime_ns):
+        img = np.load(cache_path, mmap_mode="c")
+        if(img.shape == img_shape):
+            return img
+
+    with open(txt_path, "rb") as f:
+        values = decode_hex(f.read())[: height * width]
     if(channel==1):
-        img = np.ndarray((shape[0], shape[1]), dtype=np.uint8)
+        img = values.astype(np.uint8).reshape(img_shape)
     elif(channel==3):
-        img = np.ndarray((shape[0], shape[1], 3), dtype=np.uint8)
-    height, width = shape[0], shape[1]
-    with open(txt_path, "r") as f:
-        txt = f.read().split("\n")
-    for i in range(height):
-        for j in range(width):
-            if(channel==1):
-                img[i][j] = bytes.fromhex(txt[i * width + j])[0]
-            elif(channel==3):
-                img[i][j][2], img[i][j][1], img[i][j][0] = bytes.fromhex(txt[i * width + j])
-    img = img.astype(np.uint8)
+        img = np.empty(img_shape, dtype=np.uint8)
+        img[:, :, 2] = ((values >> 16) & 0xFF).reshape(height, width)
+        img[:, :, 1] = ((values >> 8) & 0xFF).reshape(height, width)
+        img[:, :, 0] = (values & 0xFF).reshape(height, width)
+
+    if(cache):
+        try:
+            np.save(cache_path, img)
+            os.utime(cache_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        except OSError:  # 目录不可写时不缓存
+            pass
     return img
 
 
 if __name__ == "__main__":
+    import cv2
+
     dst = create_img("E:/FPGA/Xilinx/projects/ISP/ISP.srcs/sim_1/new/output/out.txt", (1080, 1920), 3)
     cv2.imshow("", cv2.resize(dst, (960, 540)))
     cv2.waitKey()
@@ -0,0 +1,36 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        jit.py
+# Descriptions:     逐像素参考模型的可选JIT编译
+# -----------------------------------------README-----------------------------------------
+# `*_loop`等逐像素模型与RTL的数据通路一一对应，保留循环的写法；用`@jit`标记的循环函数
+# 在启用时由numba编译为本地代码，未启用或没有安装numba时按原样作为Python函数执行，结果相同。
+#   ISP_JIT=1 python HE/py/HE_FPGA.py
+#   pip install numba   # 或 pip install -e .[jit]
+# 开关在模块导入时读取，需要在导入算法模块之前设置环境变量。
+# 第一次调用时编译（cache=True时缓存到__pycache__），之后的调用不再编译。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import warnings
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENABLED = os.environ.get("ISP_JIT", "0") not in ("", "0")
+
+if ENABLED and numba is None:
+    warnings.warn("ISP_JIT is set but numba is not installed, loop models run as plain Python")
+
+
+def jit(func):
+    """启用且安装了numba时编译为nopython函数，否则返回原函数"""
+    if ENABLED and numba is not None:
+        return numba.njit(cache=True)(func)
+    return func
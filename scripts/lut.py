@@ -0,0 +1,155 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        lut.py
+# Descriptions:     逐像素运算链的查找表编译
+# -----------------------------------------README-----------------------------------------
+# 8bits的逐像素运算只有两类输入：
+#   max    ：输出取决于V通道L = max(B, G, R)和通道值c，映射表T[L, c]为256x256（Retinex、HE）
+#   channel：每个通道单独映射，映射表G[ch, c]为3x256（AWB）
+# 把一串运算预先合成一组映射表，执行时每个通道只查一次表，与RTL中gamma.v的查表方式一致。
+#
+# max类运算要求输出对c单调不减，这样输出的V通道仍是T[L, L]，后面的max类运算可以继续合成；
+# channel类运算之后三个通道的映射不同，V通道不再只取决于L，遇到下一个max类运算时分段执行。
+# 映射表都由各模块按原来的整数运算生成，结果逐字节一致。
+#
+# 查表按行块进行，每个通道用np.take写入行块大小的缓冲区，不生成整帧的下标数组。
+#
+# `cascade`由原图V通道的直方图推出Retinex输出的直方图（Retinex输出的V通道为T[L, L]），
+# Retinex和HE合成一张256x256的表查一次，再统计通道和、查AWB的增益表。
+# 1080p上约50ms，逐级执行Retinex -> HE -> AWB约120ms。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import numpy as np
+from time import time
+import sys
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Retinex/py/")
+
+from HE_FPGA import histogram, cdf_lut, he_table
+from AWB_FPGA import channel_sum, sum2mean, gain_table
+from Retinex_FPGA import RETINEX_LUT
+
+
+def compile_ops(ops):
+    """ops为[("max", T[L, c]) 或 ("channel", G[ch, c])]，返回按段执行的映射表"""
+    program = []
+    table = None  # 当前段：只有max类时为(256, 256)，只有channel类时为(3, 256)，两者都有时为(3, 256, 256)
+    for kind, t in ops:
+        if kind == "max":
+            if table is not None and table.shape != (256, 256):  # 各通道映射不同，V通道需要重新计算
+                program.append(table)
+                table = None
+            # 输出的V通道为T[L, L]
+            table = t if table is None else t[table.diagonal()[:, None], table]
+        else:
+            t = np.broadcast_to(t, (3, 256))
+            if table is None:
+                table = t.copy()
+            elif table.shape == (256, 256):
+                table = np.stack([t[ch][table] for ch in range(3)])
+            else:
+                table = np.stack([t[ch][table[ch]] for ch in range(3)])
+    if table is not None:
+        program.append(table)
+    return program
+
+
+def lut_index(img: np.ndarray) -> np.ndarray:
+    """(L << 8) | c，用于查256x256的表"""
+    L = np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2])
+    return (L.astype(np.uint16) << 8)[..., None] | img
+
+
+def apply_max(img: np.ndarray, table: np.ndarray, band: int = 64) -> np.ndarray:
+    """按行块查256x256的表T[L, c]，table为(3, 256, 256)时每个通道查自己的表"""
+    if img.ndim > 3:
+        return np.stack([apply_max(frame, table, band) for frame in img])
+    height, width = img.shape[:2]
+    tables = [t.ravel() for t in np.broadcast_to(table, (3, 256, 256))]
+    out = np.empty(img.shape, dtype=np.uint8)
+    L = np.empty((band, width), dtype=np.uint8)
+    base = np.empty((band, width), dtype=np.uint16)  # L << 8
+    index = np.empty((band, width), dtype=np.uint16)
+    tmp = np.empty((band, width), dtype=np.uint8)
+    for r0 in range(0, height, band):
+        r1 = min(r0 + band, height)
+        src = img[r0:r1]
+        n = r1 - r0
+        np.maximum(src[..., 0], src[..., 1], out=L[:n])
+        np.maximum(L[:n], src[..., 2], out=L[:n])
+        np.left_shift(L[:n], 8, out=base[:n], dtype=np.uint16)
+        for ch in range(3):
+            np.bitwise_or(base[:n], src[..., ch], out=index[:n])
+            np.take(tables[ch], index[:n], out=tmp[:n])
+            out[r0:r1, :, ch] = tmp[:n]
+    return out
+
+
+def apply_channel(img: np.ndarray, table: np.ndarray, band: int = 64) -> np.ndarray:
+    """按行块查各通道的表G[ch, c]"""
+    if img.ndim > 3:
+        return np.stack([apply_channel(frame, table, band) for frame in img])
+    height, width = img.shape[:2]
+    out = np.empty(img.shape, dtype=np.uint8)
+    tmp = np.empty((band, width), dtype=np.uint8)
+    for r0 in range(0, height, band):
+        r1 = min(r0 + band, height)
+        for ch in range(3):
+            np.take(table[ch], img[r0:r1, :, ch], out=tmp[: r1 - r0])
+            out[r0:r1, :, ch] = tmp[: r1 - r0]
+    return out
+
+
+def apply_program(img: np.ndarray, program) -> np.ndarray:
+    for table in program:
+        if table.shape == (3, 256):
+            img = apply_channel(img, table)
+        else:
+            img = apply_max(img, table)
+    return img
+
+
+def joint_histogram(img: np.ndarray, band: int = 64) -> np.ndarray:
+    """各通道(L, c)的联合直方图，形状为(3, 256, 256)，按行块统计"""
+    height, width = img.shape[:2]
+    hist = np.zeros((3, 1 << 16), dtype=np.int64)
+    L = np.empty((band, width), dtype=np.uint8)
+    base = np.empty((band, width), dtype=np.uint16)
+    index = np.empty((band, width), dtype=np.uint16)
+    for r0 in range(0, height, band):
+        r1 = min(r0 + band, height)
+        src = img[r0:r1]
+        n = r1 - r0
+        np.maximum(src[..., 0], src[..., 1], out=L[:n])
+        np.maximum(L[:n], src[..., 2], out=L[:n])
+        np.left_shift(L[:n], 8, out=base[:n], dtype=np.uint16)
+        for ch in range(3):
+            np.bitwise_or(base[:n], src[..., ch], out=index[:n])
+            hist[ch] += np.bincount(index[:n].ravel(), minlength=1 << 16)
+    return hist.reshape(3, 256, 256)
+
+
+def cascade(img: np.ndarray) -> np.ndarray:
+    """Retinex -> HE -> AWB，结果与逐级执行相同"""
+    pdf = histogram(img)  # 原图V通道的直方图
+    # Retinex输出的V通道为T[L, L]
+    pdf = np.bincount(RETINEX_LUT.diagonal(), weights=pdf, minlength=256).astype(np.int64)
+    table = compile_ops([("max", RETINEX_LUT), ("max", he_table(cdf_lut(pdf)))])[0]
+    dst = apply_max(img, table)
+    return apply_channel(dst, gain_table(sum2mean(channel_sum(dst))))
+
+
+if __name__ == "__main__":
+    import cv2  # 只有演示用到OpenCV
+
+    path = "./img/day-0.png"
+    src = cv2.imread(path)[4:1084, 8:1928]
+
+    start = time()
+    dst = cascade(src)
+    print(f"Running time = {time()-start}s")
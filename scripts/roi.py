@@ -0,0 +1,224 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        roi.py
+# Descriptions:     按需计算区域的延迟求值级联
+# -----------------------------------------README-----------------------------------------
+# 级联中的每一级只记录自己的输入，不立即计算。对结果取区域（切片）时，区域沿级联向前传递，
+# 每一级只计算输出区域加上自己需要的邻域（halo）：
+#   Raw2rgb：上下左右各一行/列，上、左复制第0行/列，下、右回绕到第0行/列，列从偶数列开始保证相位
+#   Window ：3x3窗口（Sobel）上下左右各一行/列，图像边界处复制
+#   Point  ：逐像素运算（Retinex），区域不变
+#   Scale  ：由目标区域的行、列地址表得到需要的源区域，只插值目标区域
+#   Stat   ：统计量仍然在这一级的整个输入上计算（HE的直方图、AWB的通道和、CLAHE的块直方图），
+#            第一次取区域时计算并缓存整个输入和参数，之后只对请求的区域做映射
+# 因此"插值后裁剪"只对裁剪区域插值，裁剪后的统计级看到的仍然是整个裁剪区域，结果与整帧计算后切片逐字节一致。
+#   frame = Scale(AWB(HE(Point(Raw2rgb(Source(raw))[272:814, 486:1448], Retinex))), 2)
+#   dst = frame.compute()            # 或 frame[0:540, 0:960].compute() 只算左上角
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import numpy as np
+from time import time
+import sys
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./CLAHE/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Scaling/py/")
+sys.path.append("./Retinex/py/")
+sys.path.append("./Sobel/py/")
+
+from raw2rgb import demosaic
+from HE_FPGA import histogram, cdf_lut, apply_lut
+from AWB_FPGA import channel_sum, sum2mean, apply_gain
+from CLAHE_FPGA import tile_histogram, tile_cdf, tile_apply
+from BiLinear_FPGA import scale_table, interpolate
+
+
+def runs(index: np.ndarray):
+    """把下标序列分成若干段连续递增的区间[start, stop)"""
+    cut = np.flatnonzero(np.diff(index) != 1) + 1
+    return [(int(part[0]), int(part[-1]) + 1) for part in np.split(index, cut)]
+
+
+def gather(node, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """按行、列下标从node取数据，每段连续区间只取一次矩形区域"""
+    blocks = [np.concatenate([node.fetch(r0, r1, c0, c1) for c0, c1 in runs(cols)], axis=1) for r0, r1 in runs(rows)]
+    return np.concatenate(blocks, axis=0)
+
+
+class Node:
+    """延迟求值的帧，fetch(r0, r1, c0, c1)计算并返回[r0:r1, c0:c1]区域"""
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+
+    def fetch(self, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        """只支持步长为1的行、列切片，返回新的延迟帧"""
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        r0, r1, dr = rows.indices(self.shape[0])
+        c0, c1, dc = cols.indices(self.shape[1])
+        if dr != 1 or dc != 1:
+            raise ValueError("only unit-step slices are supported")
+        return Crop(self, r0, max(r1, r0), c0, max(c1, c0))
+
+    def compute(self) -> np.ndarray:
+        return self.fetch(0, self.shape[0], 0, self.shape[1])
+
+    def __array__(self, dtype=None, copy=None):
+        dst = self.compute()
+        return dst if dtype is None else dst.astype(dtype)
+
+
+class Source(Node):
+    """已有的数组（或np.memmap、FrameStore的帧），取区域时只读这一部分"""
+
+    def __init__(self, img: np.ndarray):
+        super().__init__(img.shape)
+        self.img = img
+
+    def fetch(self, r0, r1, c0, c1):
+        return np.asarray(self.img[r0:r1, c0:c1])
+
+
+class Crop(Node):
+    def __init__(self, parent: Node, r0: int, r1: int, c0: int, c1: int):
+        super().__init__((r1 - r0, c1 - c0) + parent.shape[2:])
+        self.parent = parent
+        self.top, self.left = r0, c0
+
+    def fetch(self, r0, r1, c0, c1):
+        return self.parent.fetch(self.top + r0, self.top + r1, self.left + c0, self.left + c1)
+
+
+class Raw2rgb(Node):
+    """GBRG插值，与raw2rgb整帧计算的边界处理相同"""
+
+    def __init__(self, parent: Node):
+        super().__init__(parent.shape[:2] + (3,))
+        self.parent = parent
+
+    def fetch(self, r0, r1, c0, c1):
+        height, width = self.parent.shape[:2]
+        left = c0 - c0 % 2  # demosaic的列相位从偶数列开始
+        rows = np.r_[0, np.arange(height), 0][r0 : r1 + 2]
+        cols = np.r_[0, np.arange(width), 0][left : c1 + 2]
+        return demosaic(gather(self.parent, rows, cols), r0)[:, c0 - left :]
+
+
+class Point(Node):
+    """逐像素运算，shape为输出形状（默认与输入相同）"""
+
+    def __init__(self, parent: Node, func, shape=None):
+        super().__init__(parent.shape if shape is None else shape)
+        self.parent = parent
+        self.func = func
+
+    def fetch(self, r0, r1, c0, c1):
+        return self.func(self.parent.fetch(r0, r1, c0, c1))
+
+
+class Window(Node):
+    """(2*halo+1)x(2*halo+1)窗口运算，图像边界处复制，shape为输出形状（默认与输入相同）"""
+
+    def __init__(self, parent: Node, func, halo: int = 1, shape=None):
+        super().__init__(parent.shape if shape is None else shape)
+        self.parent = parent
+        self.func = func
+        self.halo = halo
+
+    def fetch(self, r0, r1, c0, c1):
+        height, width = self.parent.shape[:2]
+        h = self.halo
+        rows = np.clip(np.arange(r0 - h, r1 + h), 0, height - 1)
+        cols = np.clip(np.arange(c0 - h, c1 + h), 0, width - 1)
+        return self.func(gather(self.parent, rows, cols))[h : h + r1 - r0, h : h + c1 - c0]
+
+
+class Stat(Node):
+    """需要整个输入统计量的级：stats(img)统计，finalize(total)得到参数，apply(img, param)映射区域"""
+
+    def __init__(self, parent: Node, stats, finalize, apply):
+        super().__init__(parent.shape)
+        self.parent = parent
+        self.stats = stats
+        self.finalize = finalize
+        self.apply = apply
+        self.img = None
+        self.param = None
+
+    def prepare(self):
+        """统计量在整个输入上计算，只算一次"""
+        if self.param is None:
+            self.img = self.parent.compute()
+            self.param = self.finalize(self.stats(self.img))
+
+    def fetch(self, r0, r1, c0, c1):
+        self.prepare()
+        return self.apply(self.img[r0:r1, c0:c1], self.param)
+
+
+def HE(parent: Node) -> Stat:
+    return Stat(parent, histogram, cdf_lut, apply_lut)
+
+
+def AWB(parent: Node) -> Stat:
+    return Stat(parent, channel_sum, sum2mean, apply_gain)
+
+
+class CLAHE(Stat):
+    def __init__(self, parent: Node, block: int = 8):
+        height, width = parent.shape[:2]
+        super().__init__(
+            parent,
+            lambda img: tile_histogram(np.maximum(np.maximum(img[..., 0], img[..., 1]), img[..., 2]), block, height),
+            lambda pdf: tile_cdf(pdf, (height // block) * (width // block)),
+            None,
+        )
+
+    def fetch(self, r0, r1, c0, c1):
+        self.prepare()
+        # 块的列插值表按整帧宽度计算，映射整行后再取列
+        return tile_apply(self.img[r0:r1], self.param, self.shape[0], row0=r0)[:, c0:c1]
+
+
+class Scale(Node):
+    """双线性插值缩放，只取目标区域需要的源区域"""
+
+    def __init__(self, parent: Node, scale: float, target_size=(1080, 1920)):
+        super().__init__(tuple(target_size[:2]) + parent.shape[2:])
+        self.parent = parent
+        self.scale = scale
+        self.rows, self.cols = scale_table(parent.shape[:2], tuple(target_size[:2]), scale)
+
+    def fetch(self, r0, r1, c0, c1):
+        num_i, next_i, v = (x[r0:r1] for x in self.rows)
+        num_j, next_j, u = (x[c0:c1] for x in self.cols)
+        top, bottom = int(num_i.min()), int(next_i.max()) + 1
+        left, right = int(num_j.min()), int(next_j.max()) + 1
+        src = self.parent.fetch(top, bottom, left, right)
+        return interpolate(src, (num_i - top, next_i - top, v), (num_j - left, next_j - left, u), self.scale)
+
+
+if __name__ == "__main__":
+    from raw2rgb import raw2rgb
+    from Retinex_FPGA import Retinex
+    import HE_FPGA
+    import AWB_FPGA
+
+    raw = np.random.randint(0, 256, (1088, 1936), dtype=np.uint8)
+
+    start = time()
+    ref = raw2rgb(raw)[272:814, 486:1448]
+    ref = AWB_FPGA.AWB(HE_FPGA.HE(Retinex(ref)))
+    print(f"Full frame: {time()-start}s")
+
+    start = time()
+    dst = AWB(HE(Point(Raw2rgb(Source(raw))[272:814, 486:1448], Retinex))).compute()
+    print(f"Lazy ROI:   {time()-start}s, identical = {np.array_equal(ref, dst)}")
@@ -0,0 +1,514 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        rtlsim.py
+# Descriptions:     RTL流水线的事务级吞吐率模型
+# -----------------------------------------README-----------------------------------------
+# 不运行Verilog仿真，估算一帧图像流过若干级RTL模块需要的周期数：
+#   python scripts/rtlsim.py --chain raw2rgb,retinex,he,awb --clock 50
+#   python scripts/rtlsim.py --chain raw2rgb,crop:184:903:328:1605,awb,scale:1.5
+#   python scripts/rtlsim.py --chain raw2rgb,crop:184:903:328:1605,awb,fifo:4096,scale:1.5
+#   python scripts/rtlsim.py --check   # 回归检查，不符合预期时返回1
+#
+# 各级之间按image_generator.v的valid/ready握手传输，每周期最多一个像素。事务以行为单位，
+# 每条连接记录每行第一个和最后一个像素完成握手的周期，行内按均匀速率插值。
+# 每一级给出两个方向的约束：
+#   forward ：由输入的到达时刻得到输出最早什么时候有效（流水线延迟、行缓存、帧统计）
+#   backward：由输出实际被取走的时刻得到输入最早什么时候能被接收（ready反压、缓存容量）
+# 反复迭代直到所有连接的时刻不再变化（各约束都是单调的max-plus关系，一定收敛）。
+#
+# 各级模型对应的RTL结构：
+#   raw2rgb/sobel：block_3x3的两行缓存，输出比输入晚一行加一个像素，一帧输入结束后
+#                  src_ready拉低一行的时间把最后一行冲出；raw2rgb只输出内部的dst_width×dst_height
+#   retinex      ：纯流水线，max+gamma+div+乘法共约9拍，没有ready
+#   he/clahe/awb ：第一帧只统计不输出（pingpong），之后用上一帧的统计量，没有ready；
+#                  he_core在src_last后用256个周期计算cdf，clahe_core每个块行用BLOCK*256个周期，
+#                  帧间隔不够时统计会出错；he/clahe的RGB延迟FIFO深度为16
+#   scale        ：img_scale的4行缓存，缓存满4行时src_ready拉低，输出没有ready，
+#                  每个输出行用到的源行由BiLinear_FPGA.axis_table得到
+#   crop         ：只屏蔽valid，ready直通
+#   fifo         ：深度可配置的FIFO，用于试验在没有ready的级之间加缓存；满时ready拉低，
+#                  行内按均匀速率插值，可能整行推迟到行内每个像素都有空位
+#
+# 报告每帧周期数、给定时钟下的帧率、首个像素的延迟、每条连接上valid=1且ready=0的周期数，
+# 以及每一级缓存的峰值占用。没有ready的级不会反压上游，它的输出被下游反压时列为违例
+# （实际硬件会丢数据，模型中按推迟传输计算），帧间隔不够等情况也列为违例。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import argparse
+import numpy as np
+from time import time
+import sys
+sys.path.append("./Scaling/py/")
+
+from BiLinear_FPGA import axis_table
+
+NEG = -(1 << 60)  # 没有约束
+
+
+def at(S, E, w: int, x):
+    """第x列像素的握手周期，行内按均匀速率插值，x超出行尾时顺延到下一行"""
+    if w == 1:
+        return S + x
+    return np.where(x <= w - 1, S + (E - S) * np.minimum(x, w - 1) // (w - 1), E + x - (w - 1))
+
+
+def settle(aS, aE, w: int):
+    """每周期最多传输一个像素：每行至少w个周期，行与行不重叠"""
+    C = w * np.arange(1, aS.size + 1, dtype=np.int64)
+    E = C + np.maximum.accumulate(np.maximum(aE, aS + w - 1) - C)
+    S = np.maximum(aS, np.concatenate([[NEG], E[:-1] + 1]))
+    return S, E
+
+
+def none(n: int):
+    return np.full(n, NEG, dtype=np.int64)
+
+
+class Link:
+    """两级之间的一条valid/ready连接，first为它的第0帧对应源图像的第几帧"""
+
+    def __init__(self, name: str, h: int, w: int, frames: int, first: int = 0):
+        self.name, self.h, self.w, self.frames, self.first = name, h, w, frames, first
+        self.S = none(h * frames)  # 每行第一个像素的握手周期
+        self.E = none(h * frames)  # 每行最后一个像素的握手周期
+        self.aS = self.aE = None  # 上游给出的最早有效时刻
+
+    def time(self, q):
+        """第q个像素（从第0帧第0个像素开始计数）的握手周期，q<0时没有约束"""
+        q = np.asarray(q)
+        line = np.clip(q // self.w, 0, self.S.size - 1)
+        t = at(self.S[line], self.E[line], self.w, q - line * self.w)
+        return np.where(q < 0, NEG, t)
+
+    def count(self, t):
+        """到周期t为止（含）完成握手的像素数"""
+        line = np.searchsorted(self.S, t, side="right") - 1
+        k = np.maximum(line, 0)
+        S, E = self.S[k], self.E[k]
+        done = np.where(t >= E, self.w, (t - S) * (self.w - 1) // np.maximum(E - S, 1) + 1)
+        return np.where(line < 0, 0, k * self.w + np.minimum(done, self.w))
+
+    def stalls(self):
+        """每帧valid=1且ready=0的周期数：上游已经有数据但没有被取走"""
+        prev = np.concatenate([[NEG], self.E[:-1] + 1])
+        start = np.maximum(self.aS, prev)  # 上游有数据且连接空闲
+        wait = np.maximum(self.S - start, 0)
+        inner = np.maximum((self.E - self.S) - np.maximum(self.aE - self.aS, self.w - 1), 0)
+        return (wait + inner).reshape(self.frames, self.h).sum(axis=1)
+
+
+class Stage:
+    """一级RTL模块的模型，stall为输出是否受dst_ready控制"""
+
+    name = ""
+    stall = True
+    warmup = 0  # 只统计不输出的帧数
+
+    def shape(self, h: int, w: int):
+        return h, w
+
+    def forward(self, src: Link, dst: Link):
+        raise NotImplementedError
+
+    def backward(self, src: Link, dst: Link):
+        raise NotImplementedError
+
+    def occupancy(self, src: Link, dst: Link):
+        """(峰值, 容量, 单位)，没有缓存时为None"""
+        return None
+
+    def check(self, src: Link, dst: Link):
+        return []
+
+    def in_flight(self, src: Link, dst: Link) -> int:
+        """已经输入但还没有输出的像素数的峰值（输入输出像素一一对应的级）"""
+        t = np.concatenate([src.S, src.E, dst.S, dst.E])
+        skip = self.warmup * src.h * src.w
+        return int(np.max(np.maximum(src.count(t) - skip, 0) - dst.count(t)))
+
+
+class Pipeline(Stage):
+    """固定延迟的流水线，没有ready"""
+
+    stall = False
+
+    def __init__(self, name: str, latency: int):
+        self.name, self.latency = name, latency
+
+    def forward(self, src, dst):
+        skip = self.warmup * src.h
+        return src.S[skip:] + self.latency, src.E[skip:] + self.latency
+
+    def backward(self, src, dst):
+        return none(src.S.size), none(src.S.size)  # 不能反压上游
+
+    def occupancy(self, src, dst):
+        return self.in_flight(src, dst), None, "px"
+
+
+class FrameStat(Pipeline):
+    """用上一帧统计量的模块：第一帧不输出，帧间隔需要留出gap个周期计算参数"""
+
+    warmup = 1
+
+    def __init__(self, name: str, latency: int, gap: int = 0, fifo: int = None):
+        super().__init__(name, latency)
+        self.gap, self.fifo = gap, fifo
+
+    def occupancy(self, src, dst):
+        return self.in_flight(src, dst), self.fifo, "px"
+
+    def check(self, src, dst):
+        messages = []
+        if self.gap and src.frames > 1:
+            blank = src.S[src.h :: src.h] - src.E[src.h - 1 : -1 : src.h] - 1
+            if blank.min() < self.gap:
+                messages.append(f"{self.name}: {blank.min()} cycles between frames, {self.gap} needed for the statistics")
+        peak = self.in_flight(src, dst)
+        if self.fifo is not None and peak > self.fifo:
+            messages.append(f"{self.name}: {peak} pixels in flight, delay FIFO depth is {self.fifo}")
+        return messages
+
+
+class Window(Stage):
+    """block_3x3的3x3窗口：两行缓存，输出第i行与输入第i+1行同步，帧尾冲出最后一行。
+    border=(上, 下, 左, 右)为不输出的边缘"""
+
+    DEPTH = 2048  # 行缓存RAM深度
+
+    def __init__(self, name: str, latency: int, border=(0, 0, 0, 0)):
+        self.name, self.latency, self.border = name, latency, border
+
+    def shape(self, h, w):
+        top, bottom, left, right = self.border
+        return h - top - bottom, w - left - right
+
+    def rows(self, src: Link):
+        """输出的每一行对应的源行（全局行号）"""
+        top, bottom = self.border[:2]
+        rows = np.arange(top, src.h - bottom)
+        return (np.arange(src.frames)[:, None] * src.h + rows).ravel(), np.tile(rows, src.frames)
+
+    def forward(self, src, dst):
+        left, right = self.border[2:]
+        w = src.w
+        idx, rows = self.rows(src)
+        nxt = np.minimum(idx + 1, src.S.size - 1)
+        # 输出第c列在输入下一行第c+1列到达时有效
+        aS = at(src.S[nxt], src.E[nxt], w, left + 1)
+        aE = at(src.S[nxt], src.E[nxt], w, w - right)
+        flush = rows == src.h - 1  # 最后一行在输入结束后逐周期冲出
+        base = src.E[idx] + 1
+        aS = np.where(flush, base + left + 1, aS)
+        aE = np.where(flush, base + w - right, aE)
+        return aS + self.latency, aE + self.latency
+
+    def backward(self, src, dst):
+        left, right = self.border[2:]
+        bS, bE = none(src.S.size), none(src.S.size)
+        idx, rows = self.rows(src)
+        lock = rows < src.h - 1  # 输入第i+1行和输出第i行同时传输，输出被反压时输入也暂停
+        bS[idx[lock] + 1] = dst.S[lock] - self.latency - (left + 1)
+        bE[idx[lock] + 1] = dst.E[lock] - self.latency + right - 1
+        # 冲出最后一行时src_ready为0
+        last = np.arange(src.h - 1, src.S.size - 1, src.h)
+        bS[last + 1] = src.E[last] + src.w + 2
+        return bS, bE
+
+    def occupancy(self, src, dst):
+        return 2 * src.w, 2 * self.DEPTH, "px"
+
+    def check(self, src, dst):
+        if src.w > self.DEPTH:
+            return [f"{self.name}: width {src.w} exceeds line buffer depth {self.DEPTH}"]
+        return []
+
+
+class Crop(Stage):
+    """只输出[top:bottom, left:right]，其余像素的valid被屏蔽，ready直通"""
+
+    def __init__(self, top: int, bottom: int, left: int, right: int):
+        self.name = "crop"
+        self.top, self.bottom, self.left, self.right = top, bottom, left, right
+
+    def shape(self, h, w):
+        return self.bottom - self.top, self.right - self.left
+
+    def rows(self, src: Link):
+        rows = np.arange(self.top, self.bottom)
+        return (np.arange(src.frames)[:, None] * src.h + rows).ravel()
+
+    def forward(self, src, dst):
+        idx = self.rows(src)
+        S, E = src.S[idx], src.E[idx]
+        return at(S, E, src.w, self.left), at(S, E, src.w, self.right - 1)
+
+    def backward(self, src, dst):
+        bS, bE = none(src.S.size), none(src.S.size)
+        idx = self.rows(src)
+        bS[idx] = dst.S - self.left
+        bE[idx] = dst.E + src.w - self.right
+        return bS, bE
+
+
+class Fifo(Stage):
+    """深度为depth个像素的FIFO，不满时ready为1"""
+
+    def __init__(self, depth: int):
+        self.name, self.depth = f"fifo{depth}", depth
+
+    def forward(self, src, dst):
+        return src.S + 1, src.E + 1
+
+    def backward(self, src, dst):
+        # 输入第q个像素要等输出取走第q-depth个像素后才能写入
+        w = src.w
+        q = np.arange(src.S.size, dtype=np.int64) * w - self.depth
+        bS, bE = dst.time(q) + 1, dst.time(q + w - 1) + 1
+        # 对应的输出像素跨两行时，行间停顿处的约束不一定在首尾两点之间的直线下方，
+        # 把这一点也按每周期一个像素折算到行首和行尾，行内插值出的每个像素都不早于可写入的时刻
+        x = w - 1 - q % w  # 对应输出上一行最后一个像素的列
+        for k in (x, x + 1):
+            t = np.where(k < w, dst.time(q + np.minimum(k, w - 1)) + 1, NEG)
+            bS = np.maximum(bS, t - k)
+            bE = np.maximum(bE, t + (w - 1 - k))
+        return bS, bE
+
+    def occupancy(self, src, dst):
+        return self.in_flight(src, dst), self.depth, "px"
+
+    def check(self, src, dst):
+        peak = self.in_flight(src, dst)
+        if peak > self.depth:
+            return [f"{self.name}: {peak} pixels buffered, depth is {self.depth}"]
+        return []
+
+
+class Scale(Stage):
+    """img_scale：4行缓存，缓存3行以上（或一帧输入完成）后连续输出，输出没有ready"""
+
+    stall = False
+    LINES = 4
+
+    def __init__(self, scale: float, size=(1080, 1920), latency: int = 4):
+        self.name = f"scale{scale:g}"
+        self.scale, self.size, self.latency = scale, tuple(size), latency
+
+    def shape(self, h, w):
+        return self.size
+
+    def table(self, h: int):
+        num, _, _ = axis_table(self.size[0], int(8 * self.scale), h)
+        return np.minimum(num, h - 1)
+
+    def forward(self, src, dst):
+        num = self.table(src.h)
+        need = np.minimum(num + 2, src.h - 1)
+        idx = (np.arange(src.frames)[:, None] * src.h + need).ravel()
+        aS = src.E[idx] + 1 + self.latency
+        return aS, aS + dst.w - 1
+
+    def backward(self, src, dst):
+        num = self.table(src.h)
+        H = dst.h
+        rows = np.arange(src.h)
+        # 第i行要等第i-4行被释放：输出开始使用第i-3行及以后的源行
+        y = np.searchsorted(num, rows - (self.LINES - 1))
+        wait = (rows >= self.LINES) & (y < H)
+        frame = np.arange(src.frames)[:, None]
+        bS = np.where(wait, dst.S[np.minimum(frame * H + y, dst.S.size - 1)], NEG)
+        # 一帧输入完成后要等输出取走最后一行才接收下一帧
+        bS[1:, 0] = dst.E[H - 1 : -1 : H] - self.latency
+        return bS.ravel(), none(src.S.size)
+
+    def occupancy(self, src, dst):
+        num = self.table(src.h)
+        line = np.searchsorted(dst.S, src.S, side="right") - 1
+        frame = np.arange(src.S.size) // src.h
+        released = np.where(line >= frame * dst.h, num[np.maximum(line, 0) % dst.h], 0)
+        held = np.arange(src.S.size) % src.h + 1 - released
+        return int(held.max()), self.LINES, "lines"
+
+
+class Source:
+    """image_generator：valid恒为1，可以加行、帧消隐"""
+
+    def __init__(self, h_blank: int = 0, v_blank: int = 0):
+        self.h_blank, self.v_blank = h_blank, v_blank
+
+    def forward(self, link: Link):
+        line = np.arange(link.S.size, dtype=np.int64)
+        S = line * (link.w + self.h_blank) + line // link.h * self.v_blank
+        return S, S + link.w - 1
+
+
+class Sink:
+    """输出端，duty为平均每周期能接收的像素数（tb中dst_ready恒为1）"""
+
+    def __init__(self, duty: float = 1.0):
+        self.duty = duty
+
+    def backward(self, link: Link):
+        cycles = int(np.ceil(link.w / self.duty))
+        return none(link.S.size), link.S + cycles - 1
+
+
+STAGES = {
+    "raw2rgb": lambda: Window("raw2rgb", 1, border=(1, 7, 1, 15)),  # 1936x1088 -> 1920x1080
+    "sobel": lambda: Window("sobel", 2 + 4),  # rgb2gray 2拍，窗口后3拍加输出寄存器
+    "retinex": lambda: Pipeline("retinex", 9),
+    "he": lambda: FrameStat("he", 2 + 2 + 7, gap=256, fifo=16),
+    "clahe": lambda: FrameStat("clahe", 2 + 5 + 7, gap=8 * 256, fifo=16),
+    "awb": lambda: FrameStat("awb", 1 + 7),
+    "crop": lambda top=3, bottom=1083, left=7, right=1927: Crop(int(top), int(bottom), int(left), int(right)),
+    "fifo": lambda depth=16: Fifo(int(depth)),
+    "scale": lambda scale=2, h=1080, w=1920: Scale(float(scale), (int(h), int(w))),
+}
+
+
+# --check时运行的回归检查：(链, 预期有违例的级)，各级缓存的峰值都不能超过容量
+CHECKS = [
+    ("raw2rgb,crop:184:903:328:1605,awb,fifo:4096,scale:1.5", ["awb"]),  # FIFO满后反压没有ready的awb
+    ("raw2rgb,crop:184:903:328:1605,awb,fifo:400000,scale:1.5", []),
+    ("raw2rgb,crop:272:814:486:1448,retinex,fifo:2000,scale:2", ["retinex"]),
+]
+
+
+def build(spec: str):
+    """"raw2rgb,retinex,fifo:4096,scale:1.5"转换为各级模型，冒号后为参数"""
+    chain = []
+    for item in spec.split(","):
+        name, *params = item.strip().split(":")
+        chain.append(STAGES[name](*params))
+    return chain
+
+
+def update(links, chain, source, sink, k: int):
+    link = links[k]
+    if k == 0:
+        aS, aE = source.forward(link)
+    else:
+        aS, aE = chain[k - 1].forward(links[k - 1], link)
+    if k == len(chain):
+        bS, bE = sink.backward(link)
+    else:
+        bS, bE = chain[k].backward(link, links[k + 1])
+    link.aS, link.aE = aS, aE
+    S, E = settle(np.maximum(aS, bS), np.maximum(aE, bE), link.w)
+    changed = not (np.array_equal(S, link.S) and np.array_equal(E, link.E))
+    link.S, link.E = S, E
+    return changed
+
+
+def simulate(chain, shape=(1088, 1936), frames: int = None, clock: float = 50e6, source=None, sink=None, max_iter: int = 10000):
+    """把frames帧（默认为统计帧数+2）依次流过chain，返回吞吐率、反压和缓存占用"""
+    source, sink = source or Source(), sink or Sink()
+    warmup = sum(stage.warmup for stage in chain)
+    frames = frames or warmup + 2
+    if frames < warmup + 2:
+        raise ValueError(f"at least {warmup + 2} frames are needed to measure the frame period")
+    h, w = shape
+    links = [Link("source", h, w, frames)]
+    for stage in chain:
+        h, w = stage.shape(h, w)
+        prev = links[-1]
+        links.append(Link(stage.name, h, w, prev.frames - stage.warmup, prev.first + stage.warmup))
+
+    order = list(range(len(links)))
+    for iteration in range(1, max_iter + 1):
+        changed = False
+        for k in order + order[::-1]:  # 先顺着数据流传递到达时刻，再逆着传递反压
+            changed |= update(links, chain, source, sink, k)
+        if not changed:
+            break
+    else:
+        raise RuntimeError(f"no convergence after {max_iter} iterations")
+
+    out = links[-1]
+    ends = out.E[out.h - 1 :: out.h]
+    period = int(ends[-1] - ends[-2])
+    violations = []
+    for k, stage in enumerate(chain):
+        src, dst = links[k], links[k + 1]
+        violations += stage.check(src, dst)
+        stalled = dst.stalls()
+        if not stage.stall and stalled.any():
+            violations.append(f"{stage.name}: output has no ready but was stalled {stalled.max()} cycles per frame")
+    links_report = []
+    for k, link in enumerate(links):
+        to = chain[k].name if k < len(chain) else "sink"
+        links_report.append({"name": f"{link.name}>{to}", "shape": (link.h, link.w), "stall": int(link.stalls()[-1])})
+    stages_report = []
+    for k, stage in enumerate(chain):
+        peak, capacity, unit = stage.occupancy(links[k], links[k + 1]) or (None, None, "")
+        stages_report.append({"name": stage.name, "peak": peak, "capacity": capacity, "unit": unit})
+    return {
+        "cycles_per_frame": period,
+        "fps": clock / period,
+        "clock": clock,
+        "latency": int(out.S[0] - links[0].S[out.first * links[0].h]),
+        "links": links_report,
+        "stages": stages_report,
+        "violations": violations,
+        "iterations": iteration,
+    }
+
+
+def check(spec: str, expected) -> list:
+    """运行一条回归检查，返回与预期不符的说明"""
+    result = simulate(build(spec))
+    errors = [f"{stage['name']}: peak {stage['peak']} exceeds capacity {stage['capacity']}"
+              for stage in result["stages"] if stage["capacity"] is not None and stage["peak"] > stage["capacity"]]
+    names = sorted({message.split(":")[0] for message in result["violations"]})
+    if names != sorted(expected):
+        errors.append(f"violations in {names}, expected {sorted(expected)}")
+    return errors
+
+
+def report(result) -> str:
+    lines = [f"{'link':24} {'shape':>11} {'stall/frame':>12}"]
+    for link in result["links"]:
+        lines.append(f"{link['name']:24} {'%dx%d' % link['shape']:>11} {link['stall']:12d}")
+    lines.append(f"{'stage':24} {'peak':>11} {'capacity':>12}")
+    for stage in result["stages"]:
+        if stage["peak"] is not None:
+            capacity = "-" if stage["capacity"] is None else stage["capacity"]
+            lines.append(f"{stage['name']:24} {stage['peak']:>11} {capacity:>12} {stage['unit']}")
+    lines.append(f"cycles/frame = {result['cycles_per_frame']}, "
+                 f"{result['fps']:.2f} fps @ {result['clock'] / 1e6:g} MHz, latency = {result['latency']} cycles")
+    for message in result["violations"]:
+        lines.append(f"violation: {message}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RTL流水线的吞吐率估算")
+    parser.add_argument("--chain", default="raw2rgb,retinex,he,awb", help=f"可选：{','.join(STAGES)}，参数用冒号分隔")
+    parser.add_argument("--shape", default="1088,1936", help="输入图像的h,w")
+    parser.add_argument("--frames", type=int, default=None)
+    parser.add_argument("--clock", type=float, default=50, help="像素时钟，MHz")
+    parser.add_argument("--hblank", type=int, default=0, help="输入的行消隐周期数")
+    parser.add_argument("--vblank", type=int, default=0, help="输入的帧消隐周期数")
+    parser.add_argument("--duty", type=float, default=1.0, help="输出端平均每周期接收的像素数")
+    parser.add_argument("--check", action="store_true", help="运行CHECKS中的回归检查，不符合时返回1")
+    args = parser.parse_args()
+
+    if args.check:
+        failed = 0
+        for spec, expected in CHECKS:
+            errors = check(spec, expected)
+            print(f"{'FAIL' if errors else 'ok':4} {spec}")
+            for message in errors:
+                print(f"     {message}")
+            failed += bool(errors)
+        sys.exit(1 if failed else 0)
+
+    start = time()
+    result = simulate(build(args.chain), tuple(int(v) for v in args.shape.split(",")), args.frames,
+                      args.clock * 1e6, Source(args.hblank, args.vblank), Sink(args.duty))
+    print(report(result))
+    print(f"Running time = {time()-start}s ({result['iterations']} iterations)")
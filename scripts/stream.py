@@ -0,0 +1,129 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        stream.py
+# Descriptions:     按行流式执行的算法级联
+# -----------------------------------------README-----------------------------------------
+# 模拟硬件的数据流：RAW数据按行块（若干行）输入，依次经过各级处理后按行块输出，
+# 每一级只缓存有限的几行，内存占用与图像高度无关，第一帧未读完即可开始输出。
+#
+# 每一级都实现`push(band, last)`：输入一个行块，返回当前能输出的行块（可能为空），
+# `last`表示该行块是一帧的最后一块。行块不能跨帧。
+#
+# 需要整帧统计量的HE和AWB与硬件一致，使用上一帧的统计结果（各模块的`HEVideo`、`AWBVideo`），
+# 第一帧原样输出。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import numpy as np
+from time import time
+import sys
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./Retinex/py/")
+
+from raw2rgb import demosaic, pad_cols
+from HE_FPGA import HEVideo
+from AWB_FPGA import AWBVideo
+from Retinex_FPGA import Retinex
+
+from img_sim import create_img
+
+
+class Raw2rgbStream:
+    """GBRG插值，行缓存3行，另存每帧第0行用于最后一行的回绕"""
+
+    def __init__(self):
+        self.row = 0  # 下一行待输出的行号
+        self.first = None  # 本帧第0行
+        self.prev = None  # 待输出行的上一行
+        self.pending = None  # 已输入但还缺下一行的行
+
+    def push(self, band: np.ndarray, last: bool) -> np.ndarray:
+        if self.first is None:
+            self.first = band[:1].copy()
+            self.prev = self.first
+            rows = band
+        else:
+            rows = np.concatenate([self.pending, band])
+        if last:
+            pad = np.concatenate([self.prev, rows, self.first])
+            dst = demosaic(pad_cols(pad), self.row)
+            self.__init__()
+            return dst
+        pad = np.concatenate([self.prev, rows])
+        dst = demosaic(pad_cols(pad), self.row)
+        self.row += dst.shape[0]
+        self.prev = rows[-2:-1].copy() if rows.shape[0] > 1 else self.prev
+        self.pending = rows[-1:].copy()
+        return dst
+
+
+class CropStream:
+    """按整帧坐标裁剪，rows和cols为(起始, 结束)"""
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.row = 0
+
+    def push(self, band: np.ndarray, last: bool) -> np.ndarray:
+        top = min(max(self.rows[0] - self.row, 0), band.shape[0])
+        bottom = min(max(self.rows[1] - self.row, 0), band.shape[0])
+        self.row = 0 if last else self.row + band.shape[0]
+        return band[top:bottom, self.cols[0] : self.cols[1]]
+
+
+class PointStream:
+    """逐像素运算，不需要缓存"""
+
+    def __init__(self, func):
+        self.func = func
+
+    def push(self, band: np.ndarray, last: bool) -> np.ndarray:
+        return self.func(band)
+
+
+def split_bands(frames, band: int = 16):
+    """把整帧序列切成行块，产生(行块, 是否为帧内最后一块)"""
+    for frame in frames:
+        height = frame.shape[0]
+        for i in range(0, height, band):
+            yield frame[i : i + band], i + band >= height
+
+
+def run_stream(bands, stages):
+    """将行块依次推过各级，产生(输出行块, 是否为帧内最后一块)"""
+    for band, last in bands:
+        for stage in stages:
+            band = stage.push(band, last)
+        yield band, last
+
+
+def isp_stages(crop=((3, 1083), (7, 1927))):
+    """raw2rgb -> 裁剪 -> Retinex -> HE -> AWB"""
+    return [
+        Raw2rgbStream(),
+        CropStream(*crop),
+        PointStream(Retinex),
+        HEVideo(),
+        AWBVideo(),
+    ]
+
+
+if __name__ == "__main__":
+    path = "./img/raw_day_0.txt"
+    src = create_img(path, (1088, 1936), 1)
+
+    start = time()
+    rows = []
+    for band, last in run_stream(split_bands([src, src]), isp_stages()):
+        rows.append(band)
+        if last:
+            dst = np.concatenate(rows)
+            rows = []
+    print(f"Running time = {time()-start}s")
+    print(dst.shape)
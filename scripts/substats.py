@@ -0,0 +1,114 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        substats.py
+# Descriptions:     取样统计量的误差报告
+# -----------------------------------------README-----------------------------------------
+# HE、CLAHE、AWB的统计量可以只取一部分像素：
+#   stride=k：每k行、k列取一个像素（`histogram`、`tile_histogram`、`channel_sum`的stride参数）
+#   bin     ：不插值，GBRG的每个2x2单元合成一个像素（`raw2rgb.bin_stats`）
+# 计数按取样比例放大，`// 8192`、`LIMIT`、`SCALE`、`// 2**21`等归一化不变。
+#
+# 对每种取样方式，用取样统计量和完整统计量分别处理同一帧，比较输出：
+#   python scripts/substats.py --strides 2,4,8 --scale 2
+# 报告统计耗时，以及各算法输出的平均绝对误差、最大绝对误差和不一致像素的比例。
+# 输入为PNG时先按GBRG采样为RAW再插值，与实际的级联相同；--scale 2可以放大到4K测耗时。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import argparse
+import cv2
+import numpy as np
+from time import perf_counter
+import sys
+sys.path.append("./Raw2rgb/py/")
+sys.path.append("./CLAHE/py/")
+sys.path.append("./HE/py/")
+sys.path.append("./AWB/py/")
+sys.path.append("./scripts/")
+
+from raw2rgb import raw2rgb, bin_stats
+from HE_FPGA import histogram, cdf_lut, apply_lut
+from CLAHE_FPGA import tile_histogram, tile_cdf, tile_apply
+from AWB_FPGA import channel_sum, sum2mean, apply_gain
+from img_sim import mosaic
+
+
+def sampled_stats(rgb: np.ndarray, stride: int, block: int = 8) -> dict:
+    """按stride取样统计，与raw2rgb_stats的记录格式相同"""
+    gray = np.maximum(np.maximum(rgb[..., 0], rgb[..., 1]), rgb[..., 2])
+    return {
+        "sum": channel_sum(rgb, stride),
+        "hist": histogram(rgb, stride),
+        "tiles": tile_histogram(gray, block, rgb.shape[0], stride=stride),
+    }
+
+
+def apply_stats(rgb: np.ndarray, stats: dict, block: int = 8) -> dict:
+    """用统计量得到HE、CLAHE、AWB的输出"""
+    height, width = rgb.shape[:2]
+    cdf = tile_cdf(stats["tiles"], (height // block) * (width // block))
+    return {
+        "HE": apply_lut(rgb, cdf_lut(stats["hist"])),
+        "CLAHE": tile_apply(rgb, cdf, height),
+        "AWB": apply_gain(rgb, sum2mean(stats["sum"])),
+    }
+
+
+def deviation(ref: np.ndarray, out: np.ndarray) -> dict:
+    diff = np.abs(ref.astype(np.int16) - out)
+    return {"mean": float(diff.mean()), "max": int(diff.max()), "differ": float((diff > 0).mean())}
+
+
+def timed(func, repeat: int = 3):
+    func()
+    start = perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (perf_counter() - start) / repeat * 1000
+
+
+def validate(raw: np.ndarray, strides=(2, 4, 8), block: int = 8):
+    """返回每种取样方式的统计耗时和各算法输出相对完整统计的误差"""
+    rgb = raw2rgb(raw)
+    exact, exact_ms = timed(lambda: sampled_stats(rgb, 1, block))
+    ref = apply_stats(rgb, exact, block)
+    methods = [(f"stride {k}", lambda k=k: sampled_stats(rgb, k, block)) for k in strides]
+    methods.append(("bin 2x2", lambda: bin_stats(raw, block=block)))
+    rows = [{"method": "exact", "stats_ms": exact_ms}]
+    for name, func in methods:
+        stats, ms = timed(func)
+        out = apply_stats(rgb, stats, block)
+        rows.append(dict({"method": name, "stats_ms": ms}, **{k: deviation(ref[k], out[k]) for k in ref}))
+    return rows
+
+
+def report(name: str, rows) -> str:
+    lines = [f"{name}: {'method':10} {'stats ms':>9}" + "".join(f" {k + ' mean/max/differ':>26}" for k in ("HE", "CLAHE", "AWB"))]
+    for row in rows:
+        line = f"{'':{len(name)}}  {row['method']:10} {row['stats_ms']:9.1f}"
+        for k in ("HE", "CLAHE", "AWB"):
+            if k in row:
+                d = row[k]
+                line += f" {d['mean']:10.3f} {d['max']:5d} {d['differ']:8.2%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="取样统计量相对完整统计量的输出误差")
+    parser.add_argument("--img", default="./img/day-0.png,./img/night-0.png")
+    parser.add_argument("--strides", default="2,4,8")
+    parser.add_argument("--scale", type=float, default=1, help="放大输入图像，如2为4K")
+    args = parser.parse_args()
+
+    strides = [int(k) for k in args.strides.split(",")]
+    start = perf_counter()
+    for path in args.img.split(","):
+        bgr = cv2.imread(path)[4:1084, 8:1928]
+        if args.scale != 1:
+            bgr = cv2.resize(bgr, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_LINEAR)
+        print(report(path, validate(mosaic(bgr), strides)))
+    print(f"Running time = {perf_counter()-start}s")
@@ -0,0 +1,26 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        temporal.py
+# Descriptions:     视频模式下统计量的帧间平滑
+# -----------------------------------------README-----------------------------------------
+# HE、CLAHE、AWB的视频模式用上一帧的统计量处理本帧，可以对统计量做一阶IIR平滑，
+# 减少场景变化时的闪烁。平滑只用加减和移位，便于在硬件上实现：
+#   state += new - (state >> k)，输出 state >> k
+# state保存平滑值的2^k倍，不会因为移位截断而产生偏差。k=0时不平滑，输出就是本帧的统计量。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import numpy as np
+
+
+def smooth(state: np.ndarray, new: np.ndarray, k: int):
+    """返回(新的state, 平滑后的统计量)，state为None时（第一帧）直接使用new"""
+    new = np.asarray(new, dtype=np.int64)
+    if state is None or k == 0:
+        state = new << k
+    else:
+        state = state + new - (state >> k)
+    return state, state >> k
@@ -0,0 +1,183 @@
+# ****************************************************************************************#
+# Encoding:         UTF-8
+# ----------------------------------------------------------------------------------------
+# File Name:        tracing.py
+# Descriptions:     算法级联的逐级耗时与内存统计
+# -----------------------------------------README-----------------------------------------
+# 需要时才启用：`Tracer.instrument(module)`把模块中的函数替换为带统计的包装，
+# 退出`with`时恢复原函数，未启用时各模块不受任何影响。
+#   with Tracer() as tracer:
+#       tracer.instrument(HE_FPGA)
+#       HE_FPGA.HE(img)
+#   tracer.save_chrome("trace.json")  # chrome://tracing 或 https://ui.perfetto.dev 打开
+#
+# 模块内部通过全局名称调用的函数（如HE中的histogram、cdf_lut、apply_lut）也会被替换，
+# 因此各阶段按调用关系嵌套记录。从其他模块导入的函数不替换，只在定义它的模块下记录一次。每次调用记录：
+#   墙钟时间、线程CPU时间、输入输出数组的形状和类型，
+#   memory=True时用tracemalloc统计调用期间的峰值新增内存和调用前后的内存变化
+#   （numpy的数组分配会报告给tracemalloc；多线程同时执行时内存无法按线程区分）。
+#
+# ----------------------------------------------------------------------------------------
+# ****************************************************************************************#
+
+
+import os
+import json
+import threading
+import functools
+import tracemalloc
+from types import FunctionType
+from time import perf_counter, thread_time
+
+
+def describe(value):
+    """数组记为"形状 类型"，元组逐项记录，其余（包括np.uint8等类型本身）忽略"""
+    if isinstance(value, type):
+        return None
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return f"{tuple(value.shape)} {value.dtype}"
+    if isinstance(value, (tuple, list)):
+        items = [describe(v) for v in value]
+        return [v for v in items if v is not None] or None
+    return None
+
+
+class Tracer:
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.events = []
+        self.patched = []  # (模块, 名称, 原函数)
+        self.local = threading.local()  # 每个线程的调用栈
+        self.lock = threading.Lock()
+        self.start = perf_counter()
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.own_tracing = True
+        else:
+            self.own_tracing = False
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, func in reversed(self.patched):
+            setattr(module, name, func)
+        self.patched = []
+        if self.own_tracing:
+            tracemalloc.stop()
+
+    def span(self, name: str, inputs=None):
+        return _Span(self, name, inputs)
+
+    def wrap(self, func, name: str = None):
+        name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(self, name, args) as span:
+                result = func(*args, **kwargs)
+                span.outputs = result
+            return result
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def instrument(self, module, names=None):
+        """替换module中的函数（默认为在module中定义、不以_开头的函数）"""
+        prefix = module.__name__
+        if names is None:
+            # 从其他模块导入的函数由定义它的模块替换，避免同一个函数记录两次
+            names = [k for k, v in vars(module).items() if isinstance(v, FunctionType) and v.__module__ == prefix]
+            names = [k for k in names if not k.startswith("_")]
+        for name in names:
+            func = getattr(module, name)
+            if hasattr(func, "__wrapped__"):  # 已经替换过
+                continue
+            self.patched.append((module, name, func))
+            setattr(module, name, self.wrap(func, f"{prefix}.{name}"))
+        return self
+
+    def record(self, event: dict):
+        with self.lock:
+            self.events.append(event)
+
+    def summary(self):
+        """按名称汇总：调用次数、总墙钟时间、总CPU时间、最大峰值内存"""
+        table = {}
+        for e in self.events:
+            row = table.setdefault(e["name"], {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "peak_mb": 0.0})
+            row["count"] += 1
+            row["wall_ms"] += e["wall_ms"]
+            row["cpu_ms"] += e["cpu_ms"]
+            row["peak_mb"] = max(row["peak_mb"], e.get("peak_mb", 0.0))
+        return table
+
+    def report(self) -> str:
+        lines = [f"{'name':40} {'count':>6} {'wall ms':>10} {'cpu ms':>10} {'peak MB':>9}"]
+        for name, row in sorted(self.summary().items(), key=lambda kv: -kv[1]["wall_ms"]):
+            lines.append(f"{name:40} {row['count']:6d} {row['wall_ms']:10.2f} {row['cpu_ms']:10.2f} {row['peak_mb']:9.1f}")
+        return "\n".join(lines)
+
+    def save_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"events": self.events, "summary": self.summary()}, f, indent=2)
+
+    def save_chrome(self, path: str):
+        """Chrome trace格式，每次调用为一个完整事件（ph="X"）"""
+        trace = []
+        for e in self.events:
+            args = {k: v for k, v in e.items() if k not in ("name", "ts_us", "tid")}
+            trace.append({
+                "name": e["name"], "ph": "X", "ts": e["ts_us"], "dur": e["wall_ms"] * 1000,
+                "pid": os.getpid(), "tid": e["tid"], "args": args,
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+class _Span:
+    def __init__(self, tracer: Tracer, name: str, inputs=None):
+        self.tracer = tracer
+        self.name = name
+        self.inputs = inputs
+        self.outputs = None
+        self.child_peak = 0
+
+    def __enter__(self):
+        stack = self.tracer.local.__dict__.setdefault("stack", [])
+        stack.append(self)
+        if tracemalloc.is_tracing():
+            self.mem_start, parent_peak = tracemalloc.get_traced_memory()
+            if len(stack) > 1:  # 重置峰值前先把已有的峰值交给上一层
+                stack[-2].child_peak = max(stack[-2].child_peak, parent_peak)
+            tracemalloc.reset_peak()
+        self.cpu = thread_time()
+        self.wall = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = perf_counter() - self.wall
+        cpu = thread_time() - self.cpu
+        stack = self.tracer.local.stack
+        stack.pop()
+        event = {
+            "name": self.name,
+            "ts_us": (self.wall - self.tracer.start) * 1e6,
+            "tid": threading.get_ident(),
+            "wall_ms": wall * 1000,
+            "cpu_ms": cpu * 1000,
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            event["peak_mb"] = (peak - self.mem_start) / 2**20
+            event["net_mb"] = (current - self.mem_start) / 2**20
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+        inputs, outputs = describe(self.inputs), describe(self.outputs)
+        if inputs:
+            event["inputs"] = inputs
+        if outputs:
+            event["outputs"] = outputs
+        self.tracer.record(event)
+        return False